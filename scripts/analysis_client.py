@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - the name of one of the analysis scripts and its usual options, e.g.
+#       analysis_client.py find_assembly_tops.py -f 401.bzip2.1.err -d 401.bzip2.dump -n 30
+#
+# OUTPUT:
+#   - that script's output, computed by a running analysis_server.py, which
+#     keeps the parsed histograms and objdumps (and what was computed from
+#     them) between runs
+#
+# Without a server, or to read a histogram from stdin ('-f -'), the script is
+# just run here. This doesn't import numpy, so it starts in a fraction of the
+# time the scripts themselves take.
+#
+#   analysis_client.py --stats    what the server holds
+#   analysis_client.py --stop     stop the server
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+SOCKET_ENV = 'ISA_ANALYSIS_SOCKET'
+
+
+# the server's socket: $ISA_ANALYSIS_SOCKET, or one per user in the temp dir
+def default_socket():
+    return os.environ.get(SOCKET_ENV) or \
+        os.path.join(tempfile.gettempdir(), 'isa-analysis-%d.sock' % os.getuid())
+
+
+# send message to the server at path and return its reply (both are one JSON
+# object per line); raises socket.error if no server is listening there
+def request(path, message):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    s.sendall(json.dumps(message) + '\n')
+    s.shutdown(socket.SHUT_WR)
+    chunks = []
+    while True:
+        buf = s.recv(1 << 16)
+        if not buf:
+            break
+        chunks.append(buf)
+    s.close()
+    return json.loads(''.join(chunks))
+
+
+def usage():
+    sys.stderr.write('usage: %s [--socket PATH] (SCRIPT [options] | --stats | --stop)\n' %
+                     os.path.basename(sys.argv[0]))
+    sys.exit(2)
+
+
+def main():
+    args = sys.argv[1:]
+    path = default_socket()
+    if args[:1] == ['--socket']:
+        if len(args) < 2:
+            usage()
+        path = args[1]
+        args = args[2:]
+    if not args:
+        usage()
+
+    if args[0] in ('--stats', '--stop'):
+        try:
+            reply = request(path, {'command': args[0][2:]})
+        except socket.error, e:
+            sys.stderr.write('no analysis server at %s (%s)\n' % (path, e))
+            sys.exit(1)
+        print json.dumps(reply, indent=2, sort_keys=True)
+        return
+
+    script = os.path.basename(args[0])
+    if not script.endswith('.py'):
+        script += '.py'
+    local = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    if '-' in args[1:]:
+        os.execv(sys.executable, [sys.executable, local] + args[1:])
+    try:
+        reply = request(path, {'script': script, 'args': args[1:], 'cwd': os.getcwd()})
+    except socket.error:
+        # no server: run the script here
+        os.execv(sys.executable, [sys.executable, local] + args[1:])
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    sys.exit(reply['status'])
+
+
+if __name__ == '__main__':
+  main()
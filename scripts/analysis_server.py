@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - requests from analysis_client.py on a Unix socket: an analysis script
+#     and its options
+#
+# OUTPUT:
+#   - that script's output, as if it had been run on its own
+#
+# The server runs the scripts' own main()s, one request at a time, with their
+# inputs and their expensive steps served from an LRU cache:
+#
+#   - histograms and objdump indexes, keyed by file and fingerprint, so a
+#     file that changes is read again
+#   - what MEMOIZED functions computed from those (rankings, hot regions,
+#     idiom and byte counts, ...), keyed by their arguments
+#
+# Everything cached counts against the --memory budget; the least recently
+# used entries go first when it runs out.
+
+import collections
+import hashlib
+import json
+import optparse
+import os
+import SocketServer
+import StringIO
+import sys
+import traceback
+
+import numpy as np
+
+import analysis_client
+import cdf
+import filecache
+import find_assembly_tops
+import find_function_tops
+import find_tops
+import fused_ops_analysis
+import fusion_rules
+import histogram
+import objdump
+import opcode_mix
+import profiling
+import regions
+
+SCRIPTS = {'find_tops.py': find_tops,
+           'find_assembly_tops.py': find_assembly_tops,
+           'find_function_tops.py': find_function_tops,
+           'fused_ops_analysis.py': fused_ops_analysis,
+           'opcode_mix.py': opcode_mix}
+
+# (owner, function name, whether arguments other than cached inputs are
+# hashed into the key). Functions whose key can't be formed are just called.
+MEMOIZED = [(cdf, 'Ranking', False),
+            (objdump.ObjdumpIndex, 'rows', False),
+            (regions, 'Regions', True),
+            (fused_ops_analysis, 'analyze', False),
+            (find_function_tops, 'function_counts', False),
+            (opcode_mix, 'opcode_mix', False)]
+
+
+class Uncacheable(Exception):
+    pass
+
+
+class Cache(object):
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = collections.OrderedDict()
+        self.sizes = {}
+        self.used = 0
+        # id() of every cached input object -> its key, so calls on them can
+        # be keyed
+        self.ids = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        return value
+
+    # cache value under key; inputs are the objects that calls can be keyed by
+    def put(self, key, value, inputs=()):
+        self.entries[key] = value
+        for (i, x) in enumerate(inputs):
+            self.ids[id(x)] = key + (i,)
+        self.sizes[key] = self.footprint(value, key)
+        self.used += self.sizes[key]
+        self.evict()
+
+    # values can grow after they're cached (a Ranking ranks more of its
+    # histogram as it's queried): measure every entry again, and evict down to
+    # the budget
+    def remeasure(self):
+        for (key, value) in self.entries.items():
+            self.sizes[key] = self.footprint(value, key)
+        self.used = sum(self.sizes.values())
+        self.evict()
+
+    def evict(self):
+        while self.used > self.budget and len(self.entries) > 1:
+            (old, old_value) = self.entries.popitem(last=False)
+            self.used -= self.sizes.pop(old)
+            for (i, k) in self.ids.items():
+                if k[:-1] == old:
+                    del self.ids[i]
+
+    # rough bytes held by the value cached under key, leaving out the cached
+    # inputs of other entries it refers to (but not its own)
+    def footprint(self, value, key, depth=0):
+        if depth > 4 or (id(value) in self.ids and self.ids[id(value)][:-1] != key):
+            return 0
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, dict):
+            return sum(self.footprint(v, key, depth + 1) for v in value.values())
+        if isinstance(value, (list, tuple)):
+            if value and isinstance(value[0], np.ndarray):
+                return sum(self.footprint(v, key, depth + 1) for v in value)
+            return 64 * len(value)
+        if hasattr(value, '__dict__'):
+            return self.footprint(vars(value), key, depth + 1)
+        return 0
+
+    # a hashable stand-in for a call argument
+    def token(self, x, hash_arrays):
+        if id(x) in self.ids:
+            return self.ids[id(x)]
+        if isinstance(x, profiling.Profiler):
+            return None
+        if isinstance(x, fusion_rules.Rule):
+            return x.name
+        if isinstance(x, (list, tuple)):
+            return tuple(self.token(y, hash_arrays) for y in x)
+        if isinstance(x, np.ndarray):
+            if not hash_arrays:
+                raise Uncacheable()
+            return (x.dtype.str, x.shape, hashlib.sha1(np.ascontiguousarray(x)).hexdigest())
+        if isinstance(x, (int, long, float, str, bool)) or x is None:
+            return x
+        raise Uncacheable()
+
+    def stats(self):
+        return {'budget_mb': self.budget >> 20, 'used_mb': float(self.used) / (1 << 20),
+                'hits': self.hits, 'misses': self.misses,
+                'entries': [{'key': repr(k), 'mb': float(self.sizes[k]) / (1 << 20)}
+                            for k in self.entries]}
+
+
+# stand-ins for the loaders and MEMOIZED functions, backed by cache
+def install(cache):
+    load_histogram = histogram.load_histogram
+    load_objdump = objdump.load_objdump
+
+    def cached_histogram(filename):
+        if histogram.is_stream(filename):
+            return load_histogram(filename)
+        fp = filecache.fingerprint(filename)
+        key = ('histogram', os.path.realpath(filename), fp['size'], fp['mtime'])
+        value = cache.get(key)
+        if value is None:
+            value = load_histogram(filename)
+            cache.put(key, value, value)
+        return value
+
+    def cached_objdump(filename, use_cache=True):
+        if not use_cache:
+            return load_objdump(filename, use_cache)
+        fp = filecache.fingerprint(filename)
+        key = ('objdump', os.path.realpath(filename), fp['size'], fp['mtime'])
+        value = cache.get(key)
+        if value is None:
+            value = load_objdump(filename, use_cache)
+            cache.put(key, value, (value,))
+        return value
+
+    histogram.load_histogram = cached_histogram
+    objdump.load_objdump = cached_objdump
+    for (owner, name, hash_arrays) in MEMOIZED:
+        setattr(owner, name, memoize(cache, getattr(owner, name), name, hash_arrays))
+
+
+def memoize(cache, f, name, hash_arrays):
+    def memoized(*args):
+        try:
+            key = (name,) + tuple(cache.token(a, hash_arrays) for a in args)
+        except Uncacheable:
+            return f(*args)
+        value = cache.get(key)
+        if value is None:
+            value = f(*args)
+            if isinstance(value, np.ndarray):
+                # shared from now on
+                value.flags.writeable = False
+            cache.put(key, value)
+        return value
+    return memoized
+
+
+# run script's main() on args in cwd; returns (status, stdout, stderr)
+def run_script(script, args, cwd):
+    module = SCRIPTS.get(script)
+    if module is None:
+        return (2, '', 'the server does not run %s (it runs: %s)\n' %
+                (script, ', '.join(sorted(SCRIPTS))))
+    (argv, stdout, stderr, old_cwd) = (sys.argv, sys.stdout, sys.stderr, os.getcwd())
+    sys.argv = [script] + list(args)
+    sys.stdout = StringIO.StringIO()
+    sys.stderr = StringIO.StringIO()
+    status = 0
+    try:
+        os.chdir(cwd)
+        module.main()
+    except SystemExit, e:
+        if isinstance(e.code, int):
+            status = e.code
+        elif e.code is not None:
+            print >> sys.stderr, e.code
+            status = 1
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        out = (status, sys.stdout.getvalue(), sys.stderr.getvalue())
+        (sys.argv, sys.stdout, sys.stderr) = (argv, stdout, stderr)
+        os.chdir(old_cwd)
+    return out
+
+
+class Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        message = json.loads(self.rfile.readline())
+        command = message.get('command')
+        if command == 'stats':
+            reply = self.server.cache.stats()
+        elif command == 'stop':
+            self.server.stopping = True
+            reply = {'stopping': True}
+        else:
+            (status, out, err) = run_script(message['script'], message.get('args', []),
+                                            message.get('cwd', '.'))
+            self.server.cache.remeasure()
+            reply = {'status': status, 'stdout': out, 'stderr': err}
+        self.wfile.write(json.dumps(reply) + '\n')
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--socket', dest='socket', default=analysis_client.default_socket(),
+                    help='Unix socket to listen on [default: %default]')
+    parser.add_option('-m', '--memory', dest='memory', type='int', default=4096,
+                    help='memory budget of the cache, in MB [default: %default]')
+    (options, args) = parser.parse_args()
+
+    if os.path.exists(options.socket):
+        try:
+            analysis_client.request(options.socket, {'command': 'stats'})
+            parser.error('a server is already listening on %s' % options.socket)
+        except IOError:
+            os.unlink(options.socket)
+
+    cache = Cache(options.memory << 20)
+    install(cache)
+    os.umask(077)
+    server = SocketServer.UnixStreamServer(options.socket, Handler)
+    server.cache = cache
+    server.stopping = False
+    print "Serving %s on %s (%d MB cache)" % (', '.join(sorted(SCRIPTS)), options.socket,
+                                               options.memory)
+    sys.stdout.flush()
+    try:
+        while not server.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(options.socket)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - sizes (numbers of unique PCs) and ISAs to benchmark
+#
+# OUTPUT:
+#   - synthetic objdumps and matching histograms of those sizes: RISC-V with a
+#     mix of 2-byte RVC and 4-byte instructions (and the fusion idioms), or
+#     x86 with 1-15 byte instructions wrapped onto continuation lines
+#   - the wall time, CPU time and peak RSS of every analysis stage on them,
+#     appended as JSON lines to a results file, and compared against the
+#     last recorded run of the same stage so regressions stand out
+#
+# The data is generated once per (ISA, size, seed) into --workdir and reused.
+# Every stage runs in a forked child that loads what the stage needs first,
+# so each peak RSS is that of a fresh process doing just that stage.
+
+import json
+import optparse
+import os
+import platform
+import resource
+import socket
+import subprocess
+import time
+
+import numpy as np
+
+import cdf
+import fused_ops_analysis
+import fusion_rules
+import histogram
+import objdump
+import regions
+
+CHUNK_SIZE = 1 << 16
+FUNCTION_SIZE = 64
+EXECUTED_FRACTION = 0.7
+REGS = ['a0', 'a1', 'a2', 'a3', 'a4', 'a5', 's0', 's1']
+X86_REGS = ['%rax', '%rbx', '%rcx', '%rdx', '%rsi', '%rdi', '%r8', '%r9']
+
+# (weight, [(size, mnemonic, operands % registers)]): the instruction
+# sequences a synthetic RISC-V binary is made of
+RISCV_TEMPLATES = [
+    (30, [(4, 'addi', '%(rd)s,%(rs1)s,16')]),
+    (15, [(2, 'mv', '%(rd)s,%(rs1)s')]),
+    (10, [(4, 'bne', '%(rd)s,%(rs1)s,10078 <func0>')]),
+    (6, [(2, 'ret', '')]),
+    (10, [(4, 'ld', '%(rd)s,8(%(rs1)s)')]),
+    (8, [(4, 'slli', '%(rd)s,%(rs1)s,0x20'), (4, 'srli', '%(rd)s,%(rd)s,0x20')]),
+    (8, [(4, 'add', '%(rd)s,%(rs1)s,%(rs2)s'), (4, 'ld', '%(rd)s,0(%(rd)s)')]),
+    (5, [(2, 'slli', '%(rd)s,%(rd)s,0x3'), (2, 'add', '%(rd)s,%(rd)s,%(rs1)s')]),
+    (4, [(4, 'lui', '%(rd)s,0x12345'), (4, 'addi', '%(rd)s,%(rd)s,16')]),
+    (4, [(4, 'sltu', '%(rd)s,%(rs1)s,%(rs2)s'), (2, 'bnez', '%(rd)s,10078 <func0>')]),
+]
+
+# (weight, size) of x86 instruction lengths
+X86_SIZES = [(10, 1), (10, 2), (20, 3), (15, 4), (15, 5), (5, 6), (10, 7),
+             (5, 8), (4, 10), (4, 11), (2, 15)]
+X86_MNEMONICS = ['mov', 'add', 'sub', 'lea', 'cmp', 'test', 'jne', 'nopw']
+
+
+def parse_size(text):
+    return int(float(text))
+
+
+# write a RISC-V objdump of num_pcs instructions to out; yields the pcs of
+# every chunk written
+def _write_riscv_dump(out, num_pcs, rng):
+    weights = np.array([w for (w, t) in RISCV_TEMPLATES], dtype=np.float64)
+    out.write('\nsynthetic:     file format elf64-littleriscv\n\n\n'
+              'Disassembly of section .text:\n\n')
+    pc = 0x10078
+    written = 0
+    while written < num_pcs:
+        n = min(CHUNK_SIZE, num_pcs - written)
+        kinds = rng.choice(len(RISCV_TEMPLATES), size=n, p=weights / weights.sum())
+        regs = rng.randint(0, len(REGS), size=(n, 3))
+        encodings = rng.randint(0, 1 << 31, size=n)
+        lines = []
+        pcs = []
+        for i in xrange(n):
+            names = dict(zip(('rd', 'rs1', 'rs2'), [REGS[r] for r in regs[i]]))
+            for (size, mnemonic, ops) in RISCV_TEMPLATES[kinds[i]][1]:
+                if len(pcs) == n:
+                    break
+                if (written + len(pcs)) % FUNCTION_SIZE == 0:
+                    lines.append('\n%016x <func%d>:\n' % (pc, (written + len(pcs)) / FUNCTION_SIZE))
+                if size == 2:
+                    enc = '%04x                ' % (encodings[i] & 0xffff)
+                else:
+                    enc = '%08x            ' % encodings[i]
+                operands = ops % names
+                if operands:
+                    lines.append('   %x:\t%s\t%s\t%s\n' % (pc, enc, mnemonic, operands))
+                else:
+                    lines.append('   %x:\t%s\t%s\n' % (pc, enc, mnemonic))
+                pcs.append(pc)
+                pc += size
+        out.write(''.join(lines))
+        written += len(pcs)
+        yield np.array(pcs, dtype=np.uint64)
+
+
+# the same for x86
+def _write_x86_dump(out, num_pcs, rng):
+    weights = np.array([w for (w, s) in X86_SIZES], dtype=np.float64)
+    sizes_table = np.array([s for (w, s) in X86_SIZES])
+    out.write('\nsynthetic:     file format elf64-x86-64\n\n\n'
+              'Disassembly of section .text:\n\n')
+    pc = 0x400400
+    written = 0
+    while written < num_pcs:
+        n = min(CHUNK_SIZE, num_pcs - written)
+        sizes = sizes_table[rng.choice(len(X86_SIZES), size=n, p=weights / weights.sum())]
+        mnemonics = rng.randint(0, len(X86_MNEMONICS), size=n)
+        regs = rng.randint(0, len(X86_REGS), size=(n, 2))
+        encoding = rng.randint(0, 256, size=15 * n)
+        lines = []
+        pcs = []
+        for i in xrange(n):
+            if (written + i) % FUNCTION_SIZE == 0:
+                lines.append('\n%016x <func%d>:\n' % (pc, (written + i) / FUNCTION_SIZE))
+            size = int(sizes[i])
+            code = ['%02x' % b for b in encoding[15 * i:15 * i + size]]
+            lines.append('  %x:\t%-21s\t%-6s %s,%s\n' %
+                         (pc, ' '.join(code[:7]) + ' ', X86_MNEMONICS[mnemonics[i]],
+                          X86_REGS[regs[i][0]], X86_REGS[regs[i][1]]))
+            for k in range(7, size, 7):
+                lines.append('  %x:\t%s \n' % (pc + k, ' '.join(code[k:k + 7])))
+            pcs.append(pc)
+            pc += size
+        out.write(''.join(lines))
+        written += n
+        yield np.array(pcs, dtype=np.uint64)
+
+
+# (objdump, histogram) file names for isa and size, generating them if needed
+def generate(workdir, isa, num_pcs, seed, binary=True):
+    base = os.path.join(workdir, '%s-%d-%d' % (isa, num_pcs, seed))
+    dump_file = base + '.dump'
+    hist_file = base + ('.bin' if binary else '.err')
+    if os.path.exists(dump_file) and os.path.exists(hist_file):
+        return (dump_file, hist_file)
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    print "Generating %s and %s" % (dump_file, hist_file)
+    rng = np.random.RandomState(seed)
+    out = open(dump_file + '.tmp', 'w')
+    writer = _write_riscv_dump if isa == 'riscv' else _write_x86_dump
+
+    # a heavy-tailed count for a random subset of the PCs, chunk by chunk
+    def hist_chunks():
+        for pcs in writer(out, num_pcs, rng):
+            executed = rng.random_sample(len(pcs)) < EXECUTED_FRACTION
+            counts = (rng.pareto(1.2, size=len(pcs)) * 10 + 1).astype(np.uint64)
+            yield (pcs[executed], counts[executed])
+
+    histogram.write_histogram(hist_file + '.tmp', hist_chunks(), binary)
+    out.close()
+    os.rename(dump_file + '.tmp', dump_file)
+    os.rename(hist_file + '.tmp', hist_file)
+    return (dump_file, hist_file)
+
+
+# the stages: name -> (setup(dump, hist) returning the stage's inputs, stage
+# taking those inputs)
+def _setup_histogram(dump_file, hist_file):
+    return (hist_file,)
+
+
+def _setup_dump(dump_file, hist_file):
+    return (dump_file,)
+
+
+def _setup_cached_dump(dump_file, hist_file):
+    objdump.load_objdump(dump_file)
+    return (dump_file,)
+
+
+def _setup_ranking(dump_file, hist_file):
+    (pcs, counts) = histogram.load_histogram(hist_file)
+    return (np.array(pcs), np.array(counts))
+
+
+def _setup_analysis(dump_file, hist_file):
+    (pcs, counts) = _setup_ranking(dump_file, hist_file)
+    return (objdump.load_objdump(dump_file), pcs, counts)
+
+
+def _histogram_load(hist_file):
+    (pcs, counts) = histogram.load_histogram(hist_file)
+    # touch the data, so a mapped file is actually read
+    return int(counts.sum())
+
+
+def _cdf(pcs, counts):
+    ranking = cdf.Ranking(pcs, counts)
+    return ranking.count_to_cdf(90.)
+
+
+def _hot_segments(index, pcs, counts):
+    rows = index.rows(pcs)
+    sizes = np.where(rows >= 0, index.sizes[rows], 0).astype(np.uint64)
+    return len(regions.Regions(pcs, counts, sizes).top_to_cdf(90.))
+
+
+def _idiom_count(index, pcs, counts):
+    row_counts = fused_ops_analysis.get_row_counts(index, pcs, counts)
+    return fused_ops_analysis.find_idiom_count(index, row_counts, fusion_rules.get_rules())
+
+
+def _total_bytes(index, pcs, counts):
+    rows = index.rows(pcs)
+    found = rows >= 0
+    return int(np.dot(counts[found], index.sizes[rows[found]].astype(np.uint64)))
+
+
+STAGES = [
+    ('histogram_load', _setup_histogram, _histogram_load),
+    ('objdump_parse', _setup_dump, objdump.parse_objdump),
+    ('objdump_cached', _setup_cached_dump, objdump.load_objdump),
+    ('cdf', _setup_ranking, _cdf),
+    ('hot_segments', _setup_analysis, _hot_segments),
+    ('idiom_count', _setup_analysis, _idiom_count),
+    ('total_bytes', _setup_analysis, _total_bytes),
+]
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# run stage in a forked child; returns its wall and CPU seconds, the peak RSS
+# of the child (KB) and how much of that the stage's setup already used
+def measure(setup, stage, dump_file, hist_file):
+    (r, w) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            args = setup(dump_file, hist_file)
+            rss_setup = _max_rss_kb()
+            cpu = time.clock()
+            wall = time.time()
+            stage(*args)
+            m = {'wall_s': time.time() - wall, 'cpu_s': time.clock() - cpu,
+                 'peak_rss_kb': _max_rss_kb(), 'setup_rss_kb': rss_setup}
+        except Exception, e:
+            m = {'error': '%s: %s' % (e.__class__.__name__, e)}
+        os.write(w, json.dumps(m))
+        os._exit(0)
+    os.close(w)
+    data = ''
+    while True:
+        buf = os.read(r, 4096)
+        if not buf:
+            break
+        data += buf
+    os.close(r)
+    os.waitpid(pid, 0)
+    if not data:
+        return {'error': 'the stage crashed'}
+    return json.loads(data)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# the last result recorded for every (isa, pcs, format, stage)
+def load_previous(filename):
+    previous = {}
+    if not os.path.exists(filename):
+        return previous
+    for line in open(filename):
+        try:
+            r = json.loads(line)
+        except ValueError:
+            continue
+        previous[(r['isa'], r['pcs'], r['format'], r['stage'])] = r
+    return previous
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-s', '--sizes', dest='sizes', default='1e4,1e5,1e6',
+                    help='comma-separated numbers of unique PCs [default: %default]')
+    parser.add_option('--isa', dest='isas', default='riscv,x86',
+                    help='comma-separated ISAs: riscv, x86 [default: %default]')
+    parser.add_option('--format', dest='format', type='choice', choices=['bin', 'text'],
+                    default='bin', help='histogram format [default: %default]')
+    parser.add_option('--stages', dest='stages',
+                    help='comma-separated stages to run (default: all of %s)' %
+                    ','.join(name for (name, setup, stage) in STAGES))
+    parser.add_option('--workdir', dest='workdir', default='bench-data',
+                    help='where the synthetic inputs are kept [default: %default]')
+    parser.add_option('--seed', dest='seed', type='int', default=1,
+                    help='random seed for the synthetic inputs [default: %default]')
+    parser.add_option('-o', '--output', dest='output', default='bench-results.jsonl',
+                    help='JSON lines file the results are appended to [default: %default]')
+    (options, args) = parser.parse_args()
+
+    try:
+        sizes = [parse_size(s) for s in options.sizes.split(',')]
+    except ValueError:
+        parser.error('sizes must be numbers: %s' % options.sizes)
+    isas = options.isas.split(',')
+    for isa in isas:
+        if isa not in ('riscv', 'x86'):
+            parser.error('unknown ISA %s' % isa)
+    stages = STAGES
+    if options.stages:
+        names = options.stages.split(',')
+        stages = [s for s in STAGES if s[0] in names]
+        if len(stages) != len(names):
+            parser.error('unknown stage in %s' % options.stages)
+
+    previous = load_previous(options.output)
+    run = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'revision': git_revision(),
+           'host': socket.gethostname(), 'python': platform.python_version(),
+           'numpy': np.__version__}
+    out = open(options.output, 'a')
+    print "%-6s %10s %-16s %9s %9s %11s %9s" % \
+        ('isa', 'pcs', 'stage', 'wall (s)', 'cpu (s)', 'peak RSS MB', 'vs last')
+    for isa in isas:
+        for num_pcs in sizes:
+            (dump_file, hist_file) = generate(options.workdir, isa, num_pcs, options.seed,
+                                              options.format == 'bin')
+            for (name, setup, stage) in stages:
+                m = measure(setup, stage, dump_file, hist_file)
+                r = dict(run)
+                r.update({'isa': isa, 'pcs': num_pcs, 'format': options.format, 'stage': name})
+                r.update(m)
+                out.write(json.dumps(r, sort_keys=True) + '\n')
+                out.flush()
+                if 'error' in m:
+                    print "%-6s %10d %-16s %s" % (isa, num_pcs, name, m['error'])
+                    continue
+                last = previous.get((isa, num_pcs, options.format, name))
+                change = ''
+                if last is not None and last.get('wall_s'):
+                    change = '%+8.1f%%' % (100. * (m['wall_s'] - last['wall_s']) / last['wall_s'])
+                print "%-6s %10d %-16s %9.3f %9.3f %11.1f %9s" % \
+                    (isa, num_pcs, name, m['wall_s'], m['cpu_s'], m['peak_rss_kb'] / 1024., change)
+    out.close()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,102 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Ranking PCs from most- to least-executed, and the CDF over that ranking.
+#
+# Only as much of the histogram as a query needs gets sorted: the hottest n
+# entries are picked with argpartition and only those are ordered. Ties are
+# broken by the higher PC first, the same order the old (freq, pc) tuple sort
+# produced.
+
+import numpy as np
+
+FIRST_RANK = 1 << 10
+
+
+# indices of the n most-executed entries, hottest first
+def top_n(pcs, counts, n):
+    if n <= 0:
+        return np.zeros(0, dtype=np.intp)
+    if n < len(counts):
+        kth = counts[np.argpartition(counts, len(counts) - n)[len(counts) - n]]
+        candidates = np.nonzero(counts >= kth)[0]
+    else:
+        candidates = np.arange(len(counts))
+    order = np.lexsort((pcs[candidates], counts[candidates]))[::-1]
+    return candidates[order[:n]]
+
+
+# the total count and the k hottest (pcs, counts), hottest first, of a
+# histogram given as (pcs, counts) chunks. Only k entries plus one chunk are
+# held at a time, so memory scales with k rather than with the histogram.
+def stream_top_k(chunks, k):
+    total = 0
+    pcs = np.zeros(0, dtype=np.uint64)
+    counts = np.zeros(0, dtype=np.uint64)
+    for (chunk_pcs, chunk_counts) in chunks:
+        total += int(chunk_counts.sum())
+        pcs = np.concatenate((pcs, chunk_pcs))
+        counts = np.concatenate((counts, chunk_counts))
+        if len(counts) > k:
+            keep = top_n(pcs, counts, k)
+            pcs = pcs[keep]
+            counts = counts[keep]
+    order = top_n(pcs, counts, k)
+    return (total, pcs[order], counts[order])
+
+
+class Ranking(object):
+
+    def __init__(self, pcs, counts):
+        self.pcs = pcs
+        self.counts = counts
+        self.total = int(counts.sum())
+        self.order = np.zeros(0, dtype=np.intp)
+        self.cumulative = np.zeros(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.counts)
+
+    # make sure at least the n hottest entries are ranked
+    def _rank(self, n):
+        n = min(n, len(self.counts))
+        if n <= len(self.order):
+            return
+        self.order = top_n(self.pcs, self.counts, n)
+        self.cumulative = np.cumsum(self.counts[self.order])
+
+    # indices of the n hottest entries
+    def top(self, n):
+        self._rank(n)
+        return self.order[:n]
+
+    # CDF (in percent) over the n hottest entries
+    def cdf(self, n):
+        self._rank(n)
+        return self.cumulative[:n] * 100. / self.total
+
+    # how many of the hottest entries it takes for the CDF to go past percent
+    # (all of them if it never does)
+    def count_to_cdf(self, percent):
+        n = FIRST_RANK
+        while True:
+            self._rank(n)
+            cdf = self.cumulative * 100. / self.total
+            i = int(np.searchsorted(cdf, percent, side='right'))
+            if i < len(cdf):
+                return i + 1
+            if len(self.order) == len(self.counts):
+                return len(cdf)
+            n *= 4
+
+    # (count, pc) pairs from most- to least-executed, ranked lazily
+    def pairs(self):
+        i = 0
+        n = FIRST_RANK
+        while i < len(self.counts):
+            order = self.top(n)
+            rest = order[i:]
+            for pair in zip(self.counts[rest].tolist(), self.pcs[rest].tolist()):
+                yield pair
+            i = len(order)
+            n *= 4
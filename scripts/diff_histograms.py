@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - two PC histograms, A and B (e.g. the same benchmark built with two
+#     compilers or flags, or for two ISAs)
+#   - (optionally) their objdump files: one if both ran the same binary, two
+#     if they didn't
+#
+# OUTPUT:
+#   - the total dynamic instructions (and bytes) of both and their delta
+#   - the functions that gained or lost the most, by absolute or relative
+#     delta in instructions or bytes
+#   - the same for single instructions
+#
+# With one binary, the histograms are joined on PC. With two binaries, PCs
+# are joined on (function, offset in the function): functions are matched by
+# name, the nth function of a name with the nth one in the other binary.
+#
+# Both joins are merges of PC-sorted arrays. With one binary the histograms
+# are streamed in chunks. With two, each is held whole and joined one function
+# at a time: binary histograms are memory-mapped, but text ones are loaded
+# into memory.
+
+import optparse
+import os
+import numpy as np
+import histogram
+import objdump
+import profiling
+
+NO_FUNCTION = '<no function>'
+SORTS = ['insts', 'bytes', 'rel-insts', 'rel-bytes']
+FIELDS = ('insts_a', 'insts_b', 'bytes_a', 'bytes_b')
+
+
+# the score entries (a dict of aligned arrays with FIELDS) are ranked by:
+# the absolute delta of insts or bytes, or that relative to A. Entries that
+# are new in B rank first by relative delta.
+def score(entries, sort):
+    kind = sort.split('-')[-1]
+    a = entries[kind + '_a'].astype(np.float64)
+    b = entries[kind + '_b'].astype(np.float64)
+    delta = np.abs(b - a)
+    if not sort.startswith('rel-'):
+        return delta
+    rel = np.zeros(len(a))
+    nonzero = a > 0
+    rel[nonzero] = delta[nonzero] / a[nonzero]
+    rel[~nonzero & (delta > 0)] = np.inf
+    return rel
+
+
+# the n highest-scoring of entries, highest first; ties go to the first
+def rank(entries, sort, n):
+    s = score(entries, sort)
+    order = np.lexsort((np.arange(len(s)), -s))[:n]
+    return order[s[order] > 0]
+
+
+# the k entries with the highest scores among everything added so far, in
+# about k plus one chunk of memory
+class TopDeltas(object):
+
+    def __init__(self, k, sort):
+        self.k = k
+        self.sort = sort
+        self.kept = None
+
+    def add(self, entries):
+        if self.kept is not None:
+            entries = dict((f, np.concatenate((self.kept[f], entries[f]))) for f in entries)
+        order = rank(entries, self.sort, self.k)
+        self.kept = dict((f, v[order]) for (f, v) in entries.items())
+
+    def entries(self):
+        return self.kept
+
+
+# the size of each of pcs in index, 0 where it isn't there or without one
+def pc_sizes(index, pcs):
+    sizes = np.zeros(len(pcs), dtype=np.uint64)
+    if index is not None:
+        rows = index.rows(pcs)
+        found = rows >= 0
+        sizes[found] = index.sizes[rows[found]]
+    return sizes
+
+
+# the index's function names, made unique by numbering repeated ones in
+# address order: 'foo', then 'foo#2', ...
+def function_keys(index):
+    seen = {}
+    keys = []
+    for name in index.symbols:
+        seen[name] = seen.get(name, 0) + 1
+        keys.append(name if seen[name] == 1 else '%s#%d' % (name, seen[name]))
+    return keys
+
+
+def new_totals(n):
+    return dict((f, np.zeros(n, dtype=np.uint64)) for f in FIELDS)
+
+
+# per-key sums of the FIELDS of entries, added into totals
+def add_by_key(totals, keys, entries):
+    n = len(totals['insts_a'])
+    for f in FIELDS:
+        totals[f] += np.bincount(keys, weights=entries[f], minlength=n).astype(np.uint64)
+
+
+# both histograms ran the same binary (or there's no objdump): join on PC
+def diff_by_pc(file_a, file_b, index, top):
+    if index is not None:
+        names = list(index.symbols) + [NO_FUNCTION]
+    else:
+        names = [NO_FUNCTION]
+    functions = new_totals(len(names))
+    streams = [histogram.iter_histogram(file_a), histogram.iter_histogram(file_b)]
+    for (pcs, (a, b)) in histogram.join_histograms(streams):
+        sizes = pc_sizes(index, pcs)
+        if index is not None and len(index.symbols):
+            funcs = index.functions(pcs)
+            offsets = pcs - index.symbol_starts[np.maximum(funcs, 0)]
+            funcs[funcs < 0] = len(names) - 1
+        else:
+            funcs = np.zeros(len(pcs), dtype=np.int64)
+            offsets = pcs
+        entries = {'pc_a': pcs, 'pc_b': pcs, 'func': funcs, 'offset': offsets,
+                   'insts_a': a, 'insts_b': b, 'bytes_a': a * sizes, 'bytes_b': b * sizes}
+        add_by_key(functions, funcs, entries)
+        top.add(entries)
+    return (names, functions)
+
+
+def check_sorted(pcs, name):
+    for start in xrange(0, len(pcs), histogram.CHUNK_SIZE):
+        chunk = pcs[max(start - 1, 0):start + histogram.CHUNK_SIZE]
+        if np.any(chunk[1:] < chunk[:-1]):
+            raise ValueError('%s is not sorted by PC' % name)
+
+
+# join a function's (offsets, counts, sizes) in A and B on offset
+def join_offsets(side_a, side_b):
+    offsets = np.union1d(side_a[0], side_b[0])
+    entries = {'offset': offsets}
+    for (side, x) in ((side_a, 'a'), (side_b, 'b')):
+        i = offsets.searchsorted(side[0])
+        for (f, values) in (('insts_', side[1]), ('bytes_', side[1] * side[2])):
+            column = np.zeros(len(offsets), dtype=np.uint64)
+            column[i] = values
+            entries[f + x] = column
+    return entries
+
+
+# the histograms ran different binaries: join on (function, offset)
+def diff_by_function(file_a, file_b, index_a, index_b, top):
+    sides = []
+    for (filename, index) in ((file_a, index_a), (file_b, index_b)):
+        (pcs, counts) = histogram.load_histogram(filename)
+        check_sorted(pcs, filename)
+        keys = np.array(function_keys(index), dtype=str)
+        starts = pcs.searchsorted(index.symbol_starts)
+        ends = pcs.searchsorted(index.symbol_ends)
+        sides.append((filename, pcs, counts, index, keys, starts, ends))
+
+    # matching functions by name: one sorted table of every name in either
+    names = np.unique(np.concatenate((sides[0][4], sides[1][4])))
+    symbols = []
+    for (filename, pcs, counts, index, keys, starts, ends) in sides:
+        symbol = np.full(len(names), -1, dtype=np.int64)
+        symbol[names.searchsorted(keys)] = np.arange(len(keys))
+        symbols.append(symbol)
+    names = names.tolist() + [NO_FUNCTION]
+    functions = new_totals(len(names))
+
+    buffered = []
+    num_buffered = 0
+    for u in xrange(len(names) - 1):
+        parts = []
+        for ((filename, pcs, counts, index, keys, starts, ends), symbol) in zip(sides, symbols):
+            s = symbol[u]
+            if s < 0 or starts[s] == ends[s]:
+                empty = np.zeros(0, dtype=np.uint64)
+                parts.append((empty, empty, empty))
+                continue
+            fpcs = np.asarray(pcs[starts[s]:ends[s]])
+            parts.append((fpcs - index.symbol_starts[s], np.asarray(counts[starts[s]:ends[s]]),
+                          pc_sizes(index, fpcs)))
+        if not len(parts[0][0]) and not len(parts[1][0]):
+            continue
+        entries = join_offsets(parts[0], parts[1])
+        n = len(entries['offset'])
+        # a side's PC is 0 (printed as '-') at offsets it never ran
+        for (x, (filename, pcs, counts, index, keys, starts, ends), symbol, part) in \
+                zip('ab', sides, symbols, parts):
+            entries['pc_' + x] = np.zeros(n, dtype=np.uint64)
+            s = symbol[u]
+            if s >= 0:
+                ran = np.in1d(entries['offset'], part[0])
+                entries['pc_' + x][ran] = entries['offset'][ran] + index.symbol_starts[s]
+        entries['func'] = np.full(n, u, dtype=np.int64)
+        for f in FIELDS:
+            functions[f][u] = entries[f].sum()
+        buffered.append(entries)
+        num_buffered += n
+        if num_buffered >= histogram.CHUNK_SIZE:
+            top.add(concat_entries(buffered))
+            buffered = []
+            num_buffered = 0
+    if buffered:
+        top.add(concat_entries(buffered))
+
+    # whatever ran outside of every function can't be matched up
+    for (x, (filename, pcs, counts, index, keys, starts, ends)) in zip('ab', sides):
+        insts = 0
+        nbytes = 0
+        for start in xrange(0, len(pcs), histogram.CHUNK_SIZE):
+            chunk_pcs = np.asarray(pcs[start:start + histogram.CHUNK_SIZE])
+            chunk_counts = np.asarray(counts[start:start + histogram.CHUNK_SIZE])
+            outside = index.functions(chunk_pcs) < 0
+            insts += int(chunk_counts[outside].sum())
+            nbytes += int(np.dot(chunk_counts[outside],
+                                 pc_sizes(index, chunk_pcs[outside])))
+        functions['insts_' + x][-1] = insts
+        functions['bytes_' + x][-1] = nbytes
+    return (names, functions)
+
+
+def concat_entries(entries):
+    return dict((f, np.concatenate([e[f] for e in entries])) for f in entries[0])
+
+
+def format_delta(a, b):
+    a = int(a)
+    b = int(b)
+    if a == 0:
+        rel = '     new' if b else '       -'
+    elif b >= 100 * a:
+        rel = '%7.0fx' % (float(b)/a)
+    else:
+        rel = '%+7.1f%%' % (100.*(b - a)/a)
+    return '%14u %14u %+14d %s' % (a, b, b - a, rel)
+
+
+def header(with_bytes):
+    h = '%14s %14s %14s %8s' % ('insts A', 'insts B', 'delta', 'rel')
+    if with_bytes:
+        h += ' %14s %14s %14s %8s' % ('bytes A', 'bytes B', 'delta', 'rel')
+    return h
+
+
+def format_row(entries, i, with_bytes):
+    row = format_delta(entries['insts_a'][i], entries['insts_b'][i])
+    if with_bytes:
+        row += ' ' + format_delta(entries['bytes_a'][i], entries['bytes_b'][i])
+    return row
+
+
+def main():
+    parser = optparse.OptionParser(
+        usage='%prog [options] -f A -f B [-d objdump | -d objdump_A -d objdump_B]')
+    parser.add_option('-f', '--histogram', dest='histogram_files', action='append',
+                    default=[], help='input histogram file (give two: A then B)')
+    parser.add_option('-d', '--objdump', dest='objdump_files', action='append',
+                    default=[], help='objdump file (one if A and B ran the same binary, else A\'s then B\'s; '
+                         'then text histograms are loaded whole)')
+    parser.add_option('-n', '--functions', dest='functions', default=20,
+                    help='number of functions to print')
+    parser.add_option('-p', '--pcs', dest='pcs', default=20,
+                    help='number of instructions to print')
+    parser.add_option('-s', '--sort', dest='sort', type='choice', choices=SORTS,
+                    default='insts',
+                    help='rank by the absolute or relative delta in insts or bytes: %s [default: %%default]' %
+                    ', '.join(SORTS))
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True,
+                    help='always re-parse the objdump files instead of using their .idx caches')
+    profiling.add_options(parser)
+    (options, args) = parser.parse_args()
+    if len(options.histogram_files) != 2:
+        parser.error('Please give the two histograms to compare with -f A -f B')
+    if len(options.objdump_files) > 2:
+        parser.error('Please give at most two objdump files')
+    if not options.objdump_files and options.sort.endswith('bytes'):
+        parser.error('ranking by bytes needs the objdump files (-d)')
+    (file_a, file_b) = options.histogram_files
+    dumps = options.objdump_files
+    with_bytes = bool(dumps)
+    if len(dumps) == 2 and os.path.realpath(dumps[0]) == os.path.realpath(dumps[1]):
+        dumps = dumps[:1]
+
+    profiler = profiling.from_options(options)
+    with profiler.stage('objdump_load'):
+        indexes = [objdump.load_objdump(d, options.cache) for d in dumps]
+    top = TopDeltas(int(options.pcs), options.sort)
+    try:
+        with profiler.stage('join'):
+            if len(indexes) == 2:
+                (names, functions) = diff_by_function(file_a, file_b, indexes[0], indexes[1], top)
+            else:
+                index = indexes[0] if indexes else None
+                (names, functions) = diff_by_pc(file_a, file_b, index, top)
+    except ValueError, e:
+        parser.error('%s (%s, %s)' % (e, file_a, file_b))
+
+    totals = dict((f, np.array([functions[f].sum()], dtype=np.uint64)) for f in FIELDS)
+    print '%-14s %s' % ('', header(with_bytes))
+    print '%-14s %s' % ('Total', format_row(totals, 0, with_bytes))
+
+    if indexes:
+        print
+        print '-------- Functions, by %s delta --------' % options.sort
+        print '%s  %s' % (header(with_bytes), 'function')
+        for f in rank(functions, options.sort, int(options.functions)):
+            print '%s  %s' % (format_row(functions, f, with_bytes), names[f])
+
+    pcs = top.entries()
+    if pcs is None or not int(options.pcs):
+        profiler.finish()
+        return
+    print
+    print '-------- Instructions, by %s delta --------' % options.sort
+    print '%16s %16s %s  %s' % ('PC A', 'PC B', header(with_bytes), 'function+offset')
+    for i in xrange(len(pcs['func'])):
+        (pc_a, pc_b) = (int(pcs['pc_a'][i]), int(pcs['pc_b'][i]))
+        if indexes and names[pcs['func'][i]] != NO_FUNCTION:
+            where = '%s+0x%x' % (names[pcs['func'][i]], int(pcs['offset'][i]))
+        else:
+            where = ''
+        print '%16s %16s %s  %s' % ('%x' % pc_a if pc_a else '-', '%x' % pc_b if pc_b else '-',
+                                    format_row(pcs, i, with_bytes), where)
+    profiler.finish()
+
+
+if __name__ == '__main__':
+  main()
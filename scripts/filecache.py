@@ -0,0 +1,128 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Sidecar caches of numpy arrays derived from an input file.
+#
+# A cache file is:
+#
+#   8 bytes   magic "ISACACHE"
+#   4 bytes   little-endian header length
+#   header    JSON: the source fingerprint, free-form metadata, and the dtype,
+#             shape and file offset of every array
+#   data      the raw arrays, each 8-byte aligned
+#
+# Arrays come back as read-only views of a memory mapping (plain ndarrays, as
+# indexing a np.memmap element by element is slow), so opening a cache only
+# reads the header. A cache is used when the source's size and mtime match; if only the
+# mtime moved, the source is hashed and compared instead.
+
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = 'ISACACHE'
+ALIGN = 8
+
+
+# cheap identity of a file; the hash is filled in lazily
+def fingerprint(filename, with_hash=False):
+    st = os.stat(filename)
+    fp = {'size': st.st_size, 'mtime': st.st_mtime}
+    if with_hash:
+        fp['sha1'] = file_hash(filename)
+    return fp
+
+
+def file_hash(filename):
+    h = hashlib.sha1()
+    f = open(filename, 'rb')
+    while True:
+        buf = f.read(1 << 20)
+        if not buf:
+            break
+        h.update(buf)
+    f.close()
+    return h.hexdigest()
+
+
+# does filename still match the fingerprint stored for it?
+def is_fresh(stored, filename):
+    current = fingerprint(filename)
+    if stored.get('size') != current['size']:
+        return False
+    if stored.get('mtime') == current['mtime']:
+        return True
+    return stored.get('sha1') == file_hash(filename)
+
+
+def _pad(n):
+    return (ALIGN - n % ALIGN) % ALIGN
+
+
+# write arrays (a dict of name -> array) derived from source to cache_file
+def save(cache_file, source, arrays, meta=None):
+    names = sorted(arrays)
+    descr = []
+    offset = 0
+    for name in names:
+        a = np.ascontiguousarray(arrays[name])
+        descr.append({'name': name, 'dtype': a.dtype.str, 'shape': list(a.shape),
+                      'offset': offset})
+        offset += a.nbytes + _pad(a.nbytes)
+    header = json.dumps({'source': fingerprint(source, with_hash=True),
+                         'meta': meta or {}, 'arrays': descr})
+    start = len(MAGIC) + 4 + len(header)
+    header += ' ' * _pad(start)
+
+    tmp = '%s.tmp%d' % (cache_file, os.getpid())
+    f = open(tmp, 'wb')
+    try:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name in names:
+            a = np.ascontiguousarray(arrays[name])
+            f.write(a.tostring())
+            f.write('\0' * _pad(a.nbytes))
+        f.close()
+        os.rename(tmp, cache_file)
+    except:
+        f.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# returns (arrays, meta) from cache_file, or None if it's missing, stale or
+# not a cache
+def load(cache_file, source):
+    try:
+        f = open(cache_file, 'rb')
+    except IOError:
+        return None
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length))
+    except (ValueError, struct.error):
+        return None
+    finally:
+        f.close()
+    if not is_fresh(header['source'], source):
+        return None
+
+    start = len(MAGIC) + 4 + length
+    arrays = {}
+    for d in header['arrays']:
+        dtype = np.dtype(str(d['dtype']))
+        shape = tuple(d['shape'])
+        if not np.prod(shape):
+            arrays[str(d['name'])] = np.zeros(shape, dtype=dtype)
+            continue
+        arrays[str(d['name'])] = np.asarray(np.memmap(cache_file, dtype=dtype, mode='r',
+                                                      offset=start + d['offset'], shape=shape))
+    return (arrays, header['meta'])
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - a histogram of PCs and times executed
+#   - an objdump file
+#
+# OUTPUT:
+#   - the most frequently-executed functions: their dynamic instructions,
+#     dynamic bytes and CDF, hottest first
+
+import optparse
+import numpy as np
+import histogram
+import objdump
+import profiling
+
+
+# per-function (instructions, bytes) executed, with the instructions outside
+# of every function as the last entry
+def function_counts(index, pcs, counts):
+    funcs = index.functions(pcs)
+    funcs[funcs < 0] = len(index.symbols)
+    rows = index.rows(pcs)
+    found = rows >= 0
+    sizes = np.zeros(len(pcs), dtype=np.uint64)
+    sizes[found] = index.sizes[rows[found]]
+
+    # summed in uint64: bincount's float64 weights lose counts above 2^53
+    nbins = len(index.symbols) + 1
+    counts = np.asarray(counts, dtype=np.uint64)
+    insts = np.zeros(nbins, dtype=np.uint64)
+    nbytes = np.zeros(nbins, dtype=np.uint64)
+    np.add.at(insts, funcs, counts)
+    np.add.at(nbytes, funcs, counts * sizes)
+    return (insts, nbytes)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-f', '--histogram', dest='histogram_file',
+                    help='input histogram file')
+    parser.add_option('-d', '--objdump', dest='objdump_file',
+                    help='input objdump file')
+    parser.add_option('-n', '--cdf', dest='cdf',
+                    help='CDF of the hottest functions to print', default=90)
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True,
+                    help='always re-parse the objdump file instead of using its .idx cache')
+    profiling.add_options(parser)
+    (options, args) = parser.parse_args()
+    if not options.histogram_file or not options.objdump_file:
+        parser.error('Please give input filenames with -f and -d')
+    max_cdf = float(options.cdf)
+
+    profiler = profiling.from_options(options)
+    with profiler.stage('histogram_load'):
+        (pcs, counts) = histogram.load_histogram(options.histogram_file)
+    total_insts = int(counts.sum())
+    if not total_insts:
+        print "%s is empty. Exiting." % (options.histogram_file)
+        profiler.finish()
+        return
+    with profiler.stage('objdump_load'):
+        index = objdump.load_objdump(options.objdump_file, options.cache)
+
+    with profiler.stage('function_counts'):
+        (insts, nbytes) = function_counts(index, pcs, counts)
+    not_in_function = int(insts[-1])
+    insts = insts[:-1]
+    nbytes = nbytes[:-1]
+
+    # hottest first; ties go to the lower address
+    order = len(insts) - 1 - np.argsort(insts[::-1], kind='mergesort')[::-1]
+    order = order[insts[order] > 0]
+    cdf_sums = np.cumsum(insts[order]) * 100. / total_insts
+
+    print '%12s %8s %8s %14s %6s  %s' % ('insts', 'percent', 'CDF', 'bytes', 'avg', 'function')
+    count = 0
+    for (i, f) in enumerate(order):
+        print '%12u %8.3f%% %8.3f%% %14u %6.3f  %s' % \
+            (insts[f], 100.*insts[f]/total_insts, cdf_sums[i], nbytes[f],
+             float(nbytes[f])/insts[f], index.symbols[f])
+        count += 1
+        if cdf_sums[i] > max_cdf:
+            break
+    print 'Total:%15u, Functions executed:%d, Number printed:%d' % (total_insts, len(order), count)
+    print 'Not in any function:%15u (%6.3f%%)' % (not_in_function, 100.*not_in_function/total_insts)
+    profiler.finish()
+
+
+if __name__ == '__main__':
+  main()
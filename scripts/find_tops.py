@@ -2,6 +2,9 @@
 # Copyright (c) 2016, The Regents of the University of California (Regents).
 # All Rights Reserved. See LICENSE for license details.
 import optparse
+import histogram
+import cdf
+import profiling
 
 def main():
   parser = optparse.OptionParser()
@@ -9,21 +12,24 @@ def main():
                     help='input histogram file')
   parser.add_option('-n', '--lines', dest='lines',
                     help='number of lines to print', default=20)
+  profiling.add_options(parser)
   (options, args) = parser.parse_args()
   if not options.filename:
     parser.error('Please give an input filename with -f')
   num_to_print = int(options.lines)
-  f = open(options.filename)
-  lines = map(lambda l: l.split(), f.readlines()[1:-4])
-  freq_pc_pairs = map(lambda l: (int(l[1]), l[0]), lines)
-  total_insts = sum(map(lambda p: p[0], freq_pc_pairs))
-  freq_pc_pairs.sort(reverse=True)
-  cdf_sum = 0.
-  for freq, pc in freq_pc_pairs[:num_to_print]:
-    percent = 100.*freq/total_insts
-    cdf_sum += percent
-    print '%8s %12u %8.3f%% %8.3f%%' % (pc, freq, percent, cdf_sum)
+  profiler = profiling.from_options(options)
+  with profiler.stage('histogram_load'):
+    (pcs, counts) = histogram.load_histogram(options.filename)
+  total_insts = int(counts.sum())
+  with profiler.stage('cdf'):
+    ranking = cdf.Ranking(pcs, counts)
+    top = ranking.top(num_to_print)
+    cdf_sums = ranking.cdf(num_to_print)
+  for i, j in enumerate(top):
+    percent = 100.*counts[j]/total_insts
+    print '%8x %12u %8.3f%% %8.3f%%' % (pcs[j], counts[j], percent, cdf_sums[i])
   print 'Total:%15u' % total_insts
+  profiler.finish()
 
 if __name__ == '__main__':
   main()
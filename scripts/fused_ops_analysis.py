@@ -15,174 +15,173 @@
 #   - the number of fused macro-ops
 #   - the number of "slli 30; srli 30" garbage due to uint32_t in RV64
 #   - only counts instructions executed in the objdump (aka, no bbl or vmlinux).
+#
+# With -a (or --stride), all of these are estimated from a sample of the
+# histogram instead, with confidence intervals; see sampling.py.
 
 import optparse
+import numpy as np
+import histogram
+import objdump
+import fusion_rules
+import results
+import profiling
+import sampling
  
 
-def get_inst_size(pc_string, assembly_dict):
-    if pc_string not in assembly_dict:
-        #print "PC (0x",pc_string,") not found!"
-        return 4
-    line = assembly_dict[pc_string]
-    bits = line.split('\t')[0].split()
-#    print line,"-bits[",bits,"]len(b[0])=",len(bits[0]),"len(bits)=",len(bits)
-    size = len(bits[0])*len(bits)/2
-    # check in x86 for wrap-around!
-    if size == 7:
-        pc = int(pc_string, 16)
-        npc = pc + size
-        npc_string = "%x" % (npc)
-        nextline = assembly_dict[npc_string]
-        if nextline.count('\t') == 0:
-            # it's a partial line
-            bits = nextline.split()
-            size += len(bits[0])*len(bits)/2
-#            print "Bits:"
-#            print bits
-#            print "    size =",size
-    return size
-
-def last_inst_was_adjacent(pc, last_pc):
-    return pc+2 == last_pc or pc+4 == last_pc
-    # only works for RISC-V
-    # check if it's either +2 or +4. if it's either, we're good.
-#    print "pc:",pc, ", last:",last_pc," - retval:",retval
-
-     
-def get3OpTypeInst(pc, asm_dict):
-    instruction = asm_dict[pc].split('\t')
-    if len(instruction) != 3:
-        return None
-    operands = instruction[2].split(',')
-    if len(operands) != 3:
-        return None
-    typ = instruction[1]
-    rd  = operands[0]
-    rs1 = operands[1]
-    imm = operands[2]
-    return (typ, rd, rs1, imm)
-
-# e.g., loads
-def get2OpTypeInst(pc, asm_dict):
-    instruction = asm_dict[pc].split('\t')
-    if len(instruction) != 3:
-        return None
-    operands = instruction[2].split(',')
-    if len(operands) != 2:
-        return None
-    typ = instruction[1]
-    rd  = operands[0]
-    addr = operands[1]
-    return (typ, rd, addr)
-
-def isShiftClearUpperIdiom(pc1, pc2, asm_dict):
-    if not pc1 in asm_dict or not pc2 in asm_dict:
-        return False
-    inst = get3OpTypeInst(pc1, asm_dict)
-    if inst:
-        (typ_1, rd_1, rs1_1, imm_1) = inst
-        if typ_1 == "slli" and imm_1 == "0x20":
-            inst_1 = inst
-            inst = get3OpTypeInst(pc2, asm_dict)
-            if inst:
-                (typ_2, rd_2, rs1_2, imm_2) = inst
-                if typ_2 == "srli" and rd_1 == rd_2 and rd_1 == rs1_2 and \
-                          (imm_2 == "0x20" or imm_2 == "0x1e" or imm_2 == "0x1d"):
-#                          (imm_2 == "0x20" or imm_2 == "0x1e" or imm_2 == "0x1d" or imm_2 == "0x1c"):
-#                    print "PC:",pc1,"- inst1:",inst_1, "   inst2:",inst
-                    return True
-    return False
-
-def isLoad(typ):
-    if len(typ) > 1:
-        t = typ[0:2]
-        return t == "ld" or t == "lw" or t == "lb" or t == "lh"
-    return False
- 
-def isIdxLoadIdiom(pc1, pc2, asm_dict):
-    if not pc1 in asm_dict or not pc2 in asm_dict:
-        return False
-    inst = get3OpTypeInst(pc1, asm_dict)
-    if inst:
-        (typ_1, rd_1, rs1_1, rs2_1) = inst
-        if (typ_1 == "add" or typ_1 == "addi"): # and rd_1 == rs1_1:
-            inst_1 = inst
-            inst = get2OpTypeInst(pc2, asm_dict)
-            if inst:
-                (typ_2, rd_2, address) = inst
-                if isLoad(typ_2) and rd_1 == rd_2 and '0(' in address and rd_1 in address:
-#                    print "IDX: PC:",pc1,"- inst1:",inst_1, "   inst2:",inst
-                    return True
-    return False
-             
-def isIdxLoadIdiomWithConst(pc1, pc2, asm_dict):
-    if not pc1 in asm_dict or not pc2 in asm_dict:
-        return False
-    inst = get3OpTypeInst(pc1, asm_dict)
-    if inst:
-        (typ_1, rd_1, rs1_1, rs2_1) = inst
-        if (typ_1 == "add" or typ_1 == "addi"): # and rd_1 == rs1_1:
-            inst_1 = inst
-            inst = get2OpTypeInst(pc2, asm_dict)
-            if inst:
-                (typ_2, rd_2, address) = inst
-                if isLoad(typ_2) and rd_1 == rd_2 and not '0(' in address and rd_1 in address:
-#                    print "ILC: PC:",pc1,"- inst1:",inst_1, "   inst2:",inst
-                    return True
-    return False
-             
-def isLeaIdiom(pc1, pc2, asm_dict):
-#    debug = False
-    #if pc1 == "35014":
-    #    debug = True
-    #    print asm_dict[pc1]
-    #    print asm_dict[pc2]
-    if not pc1 in asm_dict or not pc2 in asm_dict:
-        return False
-    inst = get3OpTypeInst(pc1, asm_dict)
-    if inst:
-        (typ_1, rd_1, rs1_1, imm) = inst
-#        if typ_1 == "slli" and rd_1 == rs1_1 and (imm == "0x1" or imm == "0x2" or imm == "0x3" or imm == "0x4"):
-        if typ_1 == "slli" and (imm == "0x1" or imm == "0x2" or imm == "0x3" or imm == "0x4"):
-            inst_1 = inst
-            inst = get3OpTypeInst(pc2, asm_dict)
-            if inst:
-                (typ_2, rd_2, rs1_2, rs2_2) = inst
-                if typ_2 == "add" and rd_1 == rd_2 and rd_1 == rs1_2:
-#                    print "LEA: PC:",pc1,"- inst1:",inst_1, "   inst2:",inst
-                    return True
-    return False
-
- 
-
-# freq_pc_pair is sorted at "most-executed" to least executed 
-# aka, it's reversed program order, if you will
-def find_idiom_count(asm_dict, freq_pc_pairs):
-
-    last_f = 0
-    last_pc = "0"
-    clr_upper_count = 0
-    idx_ld_count = 0
-    idx_ldc_count = 0
-    lea_count = 0
-
-    for (f, pc) in freq_pc_pairs:
-        if last_inst_was_adjacent(int(pc,16), int(last_pc,16)):
-            if isShiftClearUpperIdiom(pc, last_pc, asm_dict):
-                clr_upper_count += f
-            if isIdxLoadIdiom(pc, last_pc, asm_dict):
-                idx_ld_count += f
-            if isIdxLoadIdiomWithConst(pc, last_pc, asm_dict):
-                idx_ldc_count += f
-            if isLeaIdiom(pc, last_pc, asm_dict):
-                lea_count += f
-        last_f = f
-        last_f = f
-        last_pc = pc
-
-    return (clr_upper_count, idx_ld_count, idx_ldc_count, lea_count)
-
-
+# the histogram's counts, aligned with the objdump's rows (0 for lines that
+# never executed). A PC listed more than once (e.g. in concatenated
+# intervals) gets the sum of its counts.
+def get_row_counts(index, pcs, counts):
+    rows = index.rows(pcs)
+    found = rows >= 0
+    rows = rows[found]
+    counts = np.asarray(counts[found], dtype=np.uint64)
+    row_counts = np.zeros(len(index), dtype=np.uint64)
+    # plain assignment is much faster than np.add.at, and right unless some
+    # row was assigned twice, which leaves the total short
+    row_counts[rows] = counts
+    if row_counts.sum() != counts.sum():
+        row_counts[:] = 0
+        np.add.at(row_counts, rows, counts)
+    return row_counts
+
+
+# walk the objdump in program order and count, for each rule (see
+# fusion_rules.py), the pairs of adjacent instructions that form its idiom. A
+# pair is fused as often as its first instruction executes, since none of the
+# idioms start with a branch.
+def find_idiom_count(index, row_counts, rules):
+    dispatch = fusion_rules.compile_rules(rules, index.mnemonics)
+    rows = np.nonzero(row_counts > 0)[0]
+    matches = idiom_matches(index, rows, dispatch)
+    return [int(row_counts[rows[matches[:, n]]].sum()) for n in range(len(rules))]
+
+
+# which idioms (columns, by rule number) each of rows starts together with
+# the row after it
+def idiom_matches(index, rows, dispatch):
+    matches = np.zeros((len(rows), len(dispatch.rules)), dtype=bool)
+
+    # classify every instruction once: does the next one follow it directly,
+    # and can it start an idiom?
+    rows = np.asarray(rows, dtype=np.int64)
+    candidates = (rows >= 0) & (rows + 1 < len(index))
+    r = rows[candidates]
+    candidates[candidates] = (index.pcs[r + 1] == index.pcs[r] + index.sizes[r]) & \
+        np.in1d(index.mnemonic_ids[r], dispatch.first_ids)
+
+    for i in np.nonzero(candidates)[0].tolist():
+        row = int(rows[i])
+        for n in dispatch.match(row, row + 1, index):
+            matches[i, n] = True
+    return matches
+
+
+# fetch/fusion stats of one histogram against its objdump, as a dict with
+# the -c columns (total_insts, total_bytes, one count per rule, macroop_pct)
+# plus insts_not_in_program
+def analyze(pcs, counts, index, rules, profiler=profiling.DISABLED):
+    with profiler.stage('total_bytes'):
+        rows = index.rows(pcs)
+        found = rows >= 0
+        insts_not_in_program = int(counts[~found].sum())
+        total_insts = int(counts[found].sum())
+        total_bytes = int(np.dot(counts[found], index.sizes[rows[found]].astype(np.uint64)))
+
+    with profiler.stage('idiom_count'):
+        row_counts = get_row_counts(index, pcs, counts)
+        idiom_counts = find_idiom_count(index, row_counts, rules)
+    return fusion_stats(total_insts, total_bytes, insts_not_in_program, idiom_counts, rules)
+
+
+def fusion_stats(total_insts, total_bytes, insts_not_in_program, idiom_counts, rules):
+    total_macroops = total_insts - sum(idiom_counts)
+    stats = {'total_insts': total_insts,
+             'total_bytes': total_bytes,
+             'insts_not_in_program': insts_not_in_program,
+             'total_macroops': total_macroops,
+             'macroop_pct': 100.*total_macroops/total_insts if total_insts else 0.}
+    for (rule, n) in zip(rules, idiom_counts):
+        stats[rule.name] = n
+    return stats
+
+
+# analyze() a histogram given as (pcs, counts) chunks: each chunk's totals are
+# added up and its counts laid onto the objdump's rows as it arrives, so only
+# the idiom pass over those rows is left once the last one is in. Returns the
+# whole histogram and its stats.
+def analyze_stream(chunks, index, rules):
+    seen = []
+    row_counts = np.zeros(len(index), dtype=np.uint64)
+    total_insts = 0
+    total_bytes = 0
+    insts_not_in_program = 0
+    for (pcs, counts) in chunks:
+        seen.append((pcs, counts))
+        rows = index.rows(pcs)
+        found = rows >= 0
+        insts_not_in_program += int(counts[~found].sum())
+        total_insts += int(counts[found].sum())
+        total_bytes += int(np.dot(counts[found], index.sizes[rows[found]].astype(np.uint64)))
+        np.add.at(row_counts, rows[found], counts[found].astype(np.uint64))
+    (pcs, counts) = histogram.concat_chunks(seen)
+    idiom_counts = find_idiom_count(index, row_counts, rules)
+    return (pcs, counts, fusion_stats(total_insts, total_bytes, insts_not_in_program,
+                                      idiom_counts, rules))
+
+
+# estimates of analyze()'s stats, as (estimate, half-width of the confidence
+# interval for z) pairs: total_insts, total_bytes, avg_size, the percent of
+# instructions not in the program, each rule's percent and macroop_pct
+def approximate(sample, index, rules, z):
+    rows = index.rows(sample.pcs)
+    found = rows >= 0
+    counts = sample.counts
+    in_program = counts * found
+    sizes = np.zeros(len(rows))
+    sizes[found] = index.sizes[rows[found]]
+
+    # each sampled instruction is matched once, however often it was drawn
+    dispatch = fusion_rules.compile_rules(rules, index.mnemonics)
+    (unique_rows, inverse) = np.unique(rows[found], return_inverse=True)
+    matches = np.zeros((len(rows), len(rules)), dtype=bool)
+    matches[found] = idiom_matches(index, unique_rows, dispatch)[inverse]
+
+    stats = {'total_insts': sample.total(in_program, z),
+             'total_bytes': sample.total(counts * sizes, z),
+             'avg_size': sample.ratio(counts * sizes, in_program, z)}
+    (pct, hw) = sample.ratio(counts * ~found, counts, z)
+    stats['not_in_program_pct'] = (100. * pct, 100. * hw)
+    for (n, rule) in enumerate(rules):
+        (pct, hw) = sample.ratio(in_program * matches[:, n], in_program, z)
+        stats[rule.name] = (100. * pct, 100. * hw)
+    (pct, hw) = sample.ratio(in_program * (1 - matches.sum(axis=1)), in_program, z)
+    stats['macroop_pct'] = (100. * pct, 100. * hw)
+    return stats
+
+
+# estimate of the share (in percent) of the n hottest PCs of a count-weighted
+# sample, and its half-width for z
+def approximate_cdf(sample, n, z):
+    (pcs, draws) = np.unique(sample.pcs, return_counts=True)
+    share = float(np.sort(draws)[::-1][:n].sum()) / len(sample)
+    return (100. * share, 100. * z * np.sqrt(share * (1 - share) / len(sample)))
+
+
+# options naming where results are recorded in the results store
+def add_store_options(parser):
+    parser.add_option('--db', dest='db',
+                    help='also record the results in this results database (see results.py)')
+    parser.add_option('--isa', dest='isa',
+                    help='ISA to record the results under (with --db)')
+    parser.add_option('--config', dest='config', default='o3',
+                    help='compiler config to record the results under [default: %default]')
+
+
+# the -c columns, in order
+def compressed_columns(rules):
+    return ['total_insts', 'total_bytes'] + [r.name for r in rules] + ['macroop_pct']
 
 
 def main():
@@ -195,56 +194,140 @@ def main():
                     help='CDF number of top lines to print', default=40)
     parser.add_option('-c', '--compressed', dest='compressed',
                     help='Compress the printout', default=False)
+    parser.add_option('-i', '--idioms', dest='idioms',
+                    help='comma-separated idioms to count (default: %s; also: %s)' %
+                    (','.join(r.name for r in fusion_rules.get_rules()),
+                     ','.join(r.name for r in fusion_rules.RULES if not r.default)))
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True,
+                    help='always re-parse the objdump file instead of using its .idx cache')
+    parser.add_option('-a', '--approximate', dest='approximate', action='store_true',
+                    default=False,
+                    help='estimate the stats from a count-weighted sample of the histogram')
+    parser.add_option('--samples', dest='samples', type='int', default=100000,
+                    help='instructions to sample with -a [default: %default]')
+    parser.add_option('--stride', dest='stride', type='int',
+                    help='estimate from every STRIDE-th PC of a binary histogram instead')
+    parser.add_option('--confidence', dest='confidence', type='choice',
+                    choices=[str(c) for c in sorted(sampling.Z)], default='95',
+                    help='confidence level of the intervals, in percent [default: %default]')
+    parser.add_option('--seed', dest='seed', type='int',
+                    help='random seed for the sample')
+    parser.add_option('--exact', dest='exact', action='store_true', default=False,
+                    help='compute the exact stats, even with -a or --stride')
+    add_store_options(parser)
+    profiling.add_options(parser)
+    parser.add_option('--benchmark', dest='benchmark',
+                    help='benchmark to record the results under (with --db)')
+    parser.add_option('--workload', dest='workload', default='0',
+                    help='workload to record the results under [default: %default]')
     (options, args) = parser.parse_args()
     if not options.histogram_file or not options.objdump_file:
         parser.error('Please give input filenames with -f and -d')
-    num_to_print = int(options.lines)
-    h = open(options.histogram_file)
-
-    # sanitize for header, footer
-    hlines = map(lambda l: l.split(), h.readlines()[1:-4])
-
-    if not hlines:
+    if options.db and not (options.isa and options.benchmark):
+        parser.error('Please give --isa and --benchmark to record results with --db')
+    try:
+        rules = fusion_rules.get_rules(options.idioms.split(',') if options.idioms else None)
+    except ValueError, e:
+        parser.error(str(e))
+    options.approximate = (options.approximate or bool(options.stride)) and not options.exact
+    if options.approximate:
+        if options.db or options.compressed:
+            parser.error('-a and --stride give estimates; use --exact with --db or -c')
+        if options.stride and not histogram.is_binary(options.histogram_file):
+            parser.error('--stride needs a binary histogram')
+        if options.samples < 1 or (options.stride is not None and options.stride < 1):
+            parser.error('--samples and --stride must be positive')
+
+    profiler = profiling.from_options(options)
+    if options.approximate:
+        run_approximate(options, rules, profiler)
+    else:
+        run(options, rules, profiler)
+    profiler.finish()
+
+
+def run_approximate(options, rules, profiler):
+    z = sampling.Z[int(options.confidence)]
+    with profiler.stage('sample'):
+        if options.stride:
+            sample = sampling.strided(options.histogram_file, options.stride, options.seed)
+        else:
+            (pcs, counts) = histogram.load_histogram(options.histogram_file)
+            sample = sampling.count_weighted(pcs, counts, options.samples, options.seed)
+
+    if not len(sample):
         print "%s is empty. Exiting." % (options.histogram_file)
         return
 
-    freq_pc_pairs = map(lambda l: (int(l[1]), l[0]), hlines)
-    total_insts = sum(map(lambda p: p[0], freq_pc_pairs))
-
-    freq_pc_pairs.sort(reverse=True)
-    cdf_sum = 0.
-    count = 0
-    for freq, pc in freq_pc_pairs[:num_to_print]:
-        percent = 100.*freq/total_insts
-        count += 1
-        cdf_sum += percent
-#        print '%8s %12u %8.3f%% %8.3f%%' % (pc, freq, percent, cdf_sum)
-#    print 'Total:%15u, Number printed:%d' % (total_insts, count)
-
+    with profiler.stage('objdump_load'):
+        index = objdump.load_objdump(options.objdump_file, options.cache)
 
-    d = open(options.objdump_file)
-    dump_pc_assembly_pairs = [l.strip().split(':\t') for l in d.readlines() if ':\t' in l]
-    assembly_dict = dict(dump_pc_assembly_pairs)
+    with profiler.stage('approximate'):
+        stats = approximate(sample, index, rules, z)
 
+    print "====================================================="
+    print "Estimated from %d %s samples of %d PCs, with %s%% confidence intervals" % \
+        (len(sample), sample.method, sample.population, options.confidence)
+    print "%% Not in Program      : %6.3f%% +- %6.3f%%" % stats['not_in_program_pct']
+
+    print "------- Estimates for instructions in objdump file ---------"
+    print "Total Instructions      : %12.0f +- %.0f instructions" % stats['total_insts']
+    print "Total Dynamic Bytes     : %12.0f +- %.0f bytes" % stats['total_bytes']
+    print "Average Instruction Size: %6.3f +- %6.3f bytes" % stats['avg_size']
+
+    for rule in rules:
+        print "Percent of %-13s: %6.3f +- %6.3f %%" % ((rule.label,) + stats[rule.name])
+    print "Fraction of Macops/Inst : %6.3f +- %6.3f %%" % stats['macroop_pct']
+    if sample.method == 'count-weighted':
+        num_top = int(options.lines)
+        print "CDF of the %d hottest PCs: %6.3f +- %6.3f %%" % \
+            ((num_top,) + approximate_cdf(sample, num_top, z))
+
+
+def run(options, rules, profiler):
+    index = None
+    stats = None
+    if histogram.is_stream(options.histogram_file):
+        with profiler.stage('objdump_load'):
+            index = objdump.load_objdump(options.objdump_file, options.cache)
+        with profiler.stage('stream'):
+            (pcs, counts, stats) = analyze_stream(
+                histogram.iter_histogram(options.histogram_file), index, rules)
+    else:
+        with profiler.stage('histogram_load'):
+            (pcs, counts) = histogram.load_histogram(options.histogram_file)
+
+    if not len(pcs):
+        print "%s is empty. Exiting." % (options.histogram_file)
+        return
 
-    total_insts_not_in_program = sum([f for (f,pc) in freq_pc_pairs if not pc in assembly_dict])
-
-    total_bytes = sum([f*get_inst_size(pc, assembly_dict) for (f,pc) in freq_pc_pairs if pc in assembly_dict])
-    total_insts = sum([f                                  for (f,pc) in freq_pc_pairs if pc in assembly_dict])
+    if index is None:
+        with profiler.stage('objdump_load'):
+            index = objdump.load_objdump(options.objdump_file, options.cache)
 
-    (num_clrup, num_idxld, num_idxld_c, num_lea) = find_idiom_count(assembly_dict, freq_pc_pairs)
-    total_macroops = total_insts - num_idxld - num_clrup - num_idxld_c - num_lea
+    if stats is None:
+        stats = analyze(pcs, counts, index, rules, profiler)
+    total_insts = stats['total_insts']
+    total_bytes = stats['total_bytes']
+    total_macroops = stats['total_macroops']
+    idiom_counts = [stats[r.name] for r in rules]
 
+    if options.db:
+        db = results.open_store(options.db)
+        results.record(db, options.isa, options.benchmark, options.workload,
+                       options.config, stats)
+        db.close()
 
     if options.compressed:
-        print "%12u\t%13u\t%12u\t%12u\t%12u\t%12u\t%6.3f" % \
-            (total_insts, total_bytes, num_idxld, num_idxld_c, num_clrup, num_lea, 100.*total_macroops/total_insts)
+        print "%12u\t%13u\t" % (total_insts, total_bytes) + \
+            "".join(["%12u\t" % n for n in idiom_counts]) + \
+            "%6.3f" % (stats['macroop_pct'])
         return
 
     print "====================================================="
-    print "Number Insts Not in Pro: %12u bytes" % (total_insts_not_in_program)
+    print "Number Insts Not in Pro: %12u bytes" % (stats['insts_not_in_program'])
     print "%% Not in Program      : %6.3f%%" % \
-        (sum([(100.*f/total_insts) for (f,pc) in freq_pc_pairs if not pc in assembly_dict]))
+        (100.*stats['insts_not_in_program']/total_insts)
 
     
     print "------- Stats for instructions in objdump file ---------"
@@ -252,12 +335,9 @@ def main():
     print "Total Dynamic Bytes     : %12u bytes" % (total_bytes)
     print "Average Instruction Size: %6.3f bytes" % (float(total_bytes)/total_insts)
 
-    print "Number of  IdxLoads     : %12u " % (num_idxld)
-    print "Percent of IdxLoads     : %6.3f %%" % (100.*num_idxld/total_insts)
-    print "Number of SLLI/SRL-30s  : %12u " % (num_clrup)
-    print "Percent of SLLI/SRL-30s : %6.3f %%" % (100.*num_clrup/total_insts)
-    print "Number of  LEAs         : %12u " % (num_lea)
-    print "Percent of LEAs         : %6.3f %%" % (100.*num_lea/total_insts)
+    for (rule, n) in zip(rules, idiom_counts):
+        print "Number of  %-13s: %12u " % (rule.label, n)
+        print "Percent of %-13s: %6.3f %%" % (rule.label, 100.*n/total_insts)
     print "Total Macro-ops         : %12u instructions" % (total_macroops)
     print "Fraction of Macops/Inst : %6.3f %%" % (100.*total_macroops/total_insts)
                                                                
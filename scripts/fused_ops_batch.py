@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - a manifest of (histogram, objdump) pairs, one per line:
+#
+#         <histogram file> <objdump file> [name [workload]]
+#
+#     blank lines and lines starting with '#' are ignored; the name defaults
+#     to the histogram file's name. With --db, results are recorded with the
+#     name as the benchmark.
+#
+# OUTPUT:
+#   - one table (CSV or JSON) with a row per manifest entry and the same
+#     columns fused_ops_analysis.py -c prints
+#
+# Every objdump is parsed once, before the worker pool starts; the workers are
+# forked from this process and share the parsed indexes, so any number of
+# histograms can point at the same binary.
+
+import collections
+import csv
+import json
+import multiprocessing
+import optparse
+import os
+import sys
+
+import fusion_rules
+import fused_ops_analysis
+import histogram
+import objdump
+import results
+
+# objdump file -> ObjdumpIndex, filled in before the pool forks
+INDEXES = {}
+
+
+def read_manifest(filename):
+    entries = []
+    f = open(filename)
+    for (lineno, line) in enumerate(f):
+        bits = line.split()
+        if not bits or bits[0].startswith('#'):
+            continue
+        if len(bits) not in (2, 3, 4):
+            raise ValueError('%s:%d: expected "<histogram> <objdump> [name [workload]]"' %
+                             (filename, lineno + 1))
+        name = bits[2] if len(bits) >= 3 else os.path.basename(bits[0])
+        workload = bits[3] if len(bits) == 4 else '0'
+        entries.append((name, workload, bits[0], bits[1]))
+    f.close()
+    return entries
+
+
+def analyze_entry(args):
+    (name, workload, histogram_file, objdump_file, rule_names) = args
+    rules = fusion_rules.get_rules(rule_names)
+    (pcs, counts) = histogram.load_histogram(histogram_file)
+    if not len(pcs):
+        return None
+    stats = fused_ops_analysis.analyze(pcs, counts, INDEXES[objdump_file], rules)
+    return (name, workload, histogram_file, objdump_file, stats)
+
+
+def write_csv(out, columns, rows):
+    w = csv.writer(out, lineterminator='\n')
+    w.writerow(columns)
+    for stats in rows:
+        row = [stats[c] for c in columns]
+        w.writerow(['%.3f' % v if isinstance(v, float) else v for v in row])
+
+
+def write_json(out, columns, rows):
+    json.dump([collections.OrderedDict((c, stats[c]) for c in columns) for stats in rows],
+              out, indent=1, separators=(',', ': '))
+    out.write('\n')
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] manifest')
+    parser.add_option('-o', '--output', dest='output',
+                    help='output file (default: stdout)')
+    parser.add_option('--format', dest='format', type='choice',
+                    choices=['csv', 'json'], default='csv',
+                    help='output format: csv or json [default: %default]')
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='number of worker processes [default: %default]')
+    parser.add_option('-i', '--idioms', dest='idioms',
+                    help='comma-separated idioms to count (see fused_ops_analysis.py -h)')
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True,
+                    help='always re-parse the objdump files instead of using their .idx caches')
+    fused_ops_analysis.add_store_options(parser)
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Please give a manifest file')
+    if options.db and not options.isa:
+        parser.error('Please give --isa to record results with --db')
+    rule_names = options.idioms.split(',') if options.idioms else None
+    try:
+        rules = fusion_rules.get_rules(rule_names)
+        entries = read_manifest(args[0])
+    except ValueError, e:
+        parser.error(str(e))
+
+    for (name, workload, histogram_file, objdump_file) in entries:
+        if objdump_file not in INDEXES:
+            INDEXES[objdump_file] = objdump.load_objdump(objdump_file, options.cache)
+
+    tasks = [entry + (rule_names,) for entry in entries]
+    if options.jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(options.jobs, len(tasks)))
+        analyzed = pool.map(analyze_entry, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        analyzed = map(analyze_entry, tasks)
+
+    for (task, result) in zip(tasks, analyzed):
+        if result is None:
+            print >>sys.stderr, "%s is empty. Skipping." % (task[2])
+    analyzed = [result for result in analyzed if result is not None]
+
+    if options.db:
+        db = results.open_store(options.db)
+        for (name, workload, histogram_file, objdump_file, stats) in analyzed:
+            results.record(db, options.isa, name, workload, options.config, stats)
+        db.close()
+
+    rows = []
+    for (name, workload, histogram_file, objdump_file, stats) in analyzed:
+        row = dict(stats)
+        row.update({'name': name, 'histogram': histogram_file, 'objdump': objdump_file})
+        rows.append(row)
+
+    columns = ['name', 'histogram', 'objdump'] + fused_ops_analysis.compressed_columns(rules)
+    out = open(options.output, 'w') if options.output else sys.stdout
+    if options.format == 'json':
+        write_json(out, columns, rows)
+    else:
+        write_csv(out, columns, rows)
+    if options.output:
+        out.close()
+
+
+if __name__ == '__main__':
+  main()
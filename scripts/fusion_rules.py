@@ -0,0 +1,172 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Macro-op fusion idioms, declared as data.
+#
+# An idiom is a pair of adjacent instructions. Each side is an Inst pattern:
+# the mnemonics it may have (exactly, or by prefix), how many operands it has,
+# and which values given operands may take. On top of that a Rule lists the
+# operands that must be equal across the pair ((i, j) means operand i of the
+# first instruction == operand j of the second) and, for anything else, a
+# 'where' function of both operand lists.
+#
+# compile_rules() turns the rules into a dispatch table keyed by the first
+# instruction's mnemonic id in a given objdump index, so a pair is only tested
+# against the rules that could possibly match it.
+
+import numpy as np
+
+
+class Inst(object):
+
+    def __init__(self, mnemonics=(), prefixes=(), operands=None, values=None):
+        self.mnemonics = frozenset(mnemonics)
+        self.prefixes = tuple(prefixes)
+        self.operands = operands
+        self.values = values or {}
+
+    def accepts_mnemonic(self, mnemonic):
+        return mnemonic in self.mnemonics or \
+            (bool(self.prefixes) and mnemonic.startswith(self.prefixes))
+
+    def matches(self, ops):
+        if self.operands is not None and len(ops) != self.operands:
+            return False
+        for (i, allowed) in self.values.items():
+            if i >= len(ops) or ops[i] not in allowed:
+                return False
+        return True
+
+
+class Rule(object):
+
+    def __init__(self, name, label, first, second, same=(), where=None, default=True):
+        self.name = name
+        self.label = label
+        self.first = first
+        self.second = second
+        self.same = tuple(same)
+        self.where = where
+        # counted unless the user picks the idioms explicitly
+        self.default = default
+
+    def matches(self, ops1, ops2):
+        if not self.first.matches(ops1) or not self.second.matches(ops2):
+            return False
+        for (i, j) in self.same:
+            if ops1[i] != ops2[j]:
+                return False
+        return self.where is None or self.where(ops1, ops2)
+
+
+RULES = []
+
+
+def register(rule):
+    RULES.append(rule)
+    return rule
+
+
+def get_rules(names=None):
+    if names is None:
+        return [r for r in RULES if r.default]
+    by_name = dict((r.name, r) for r in RULES)
+    for n in names:
+        if n not in by_name:
+            raise ValueError('unknown idiom %s (known: %s)' %
+                             (n, ', '.join(r.name for r in RULES)))
+    return [by_name[n] for n in names]
+
+
+LOADS = ('ld', 'lw', 'lb', 'lh')
+
+
+# add rd, rs1, rs2; ld rd, 0(rd)
+register(Rule('idxld', 'IdxLoads',
+              Inst(('add', 'addi'), operands=3),
+              Inst(prefixes=LOADS, operands=2),
+              same=[(0, 0)],
+              where=lambda o1, o2: '0(' in o2[1] and o1[0] in o2[1]))
+
+# add rd, rs1, rs2; ld rd, imm(rd)
+register(Rule('idxld_c', 'IdxLoads+Imm',
+              Inst(('add', 'addi'), operands=3),
+              Inst(prefixes=LOADS, operands=2),
+              same=[(0, 0)],
+              where=lambda o1, o2: '0(' not in o2[1] and o1[0] in o2[1]))
+
+# slli rd, rs1, 32; srli rd, rd, 32 (or 30, 29): zero-extending a uint32_t
+register(Rule('clrup', 'SLLI/SRL-30s',
+              Inst(('slli',), operands=3, values={2: ('0x20',)}),
+              Inst(('srli',), operands=3, values={2: ('0x20', '0x1e', '0x1d')}),
+              same=[(0, 0), (0, 1)]))
+
+# slli rd, rs1, {1,2,3,4}; add rd, rd, rs2
+register(Rule('lea', 'LEAs',
+              Inst(('slli',), operands=3, values={2: ('0x1', '0x2', '0x3', '0x4')}),
+              Inst(('add',), operands=3),
+              same=[(0, 0), (0, 1)]))
+
+# the idioms below aren't counted unless asked for with -i
+
+# lui rd, imm; addi rd, rd, imm: a 32-bit constant
+register(Rule('lui_addi', 'LUI+ADDIs',
+              Inst(('lui',), operands=2),
+              Inst(('addi', 'addiw'), operands=3),
+              same=[(0, 0), (0, 1)], default=False))
+
+# auipc rd, imm; addi rd, rd, imm: a PC-relative address
+register(Rule('auipc_addi', 'AUIPC+ADDIs',
+              Inst(('auipc',), operands=2),
+              Inst(('addi',), operands=3),
+              same=[(0, 0), (0, 1)], default=False))
+
+# auipc rd, imm; jalr imm(rd): a far call
+register(Rule('auipc_jalr', 'AUIPC+JALRs',
+              Inst(('auipc',), operands=2),
+              Inst(('jalr',)),
+              where=lambda o1, o2: '(' + o1[0] + ')' in o2[-1], default=False))
+
+# auipc rd, imm; ld rd, imm(rd): a PC-relative load
+register(Rule('auipc_ld', 'AUIPC+Loads',
+              Inst(('auipc',), operands=2),
+              Inst(prefixes=LOADS, operands=2),
+              same=[(0, 0)],
+              where=lambda o1, o2: '(' + o1[0] + ')' in o2[1], default=False))
+
+# slt rd, rs1, rs2; bnez rd, target: compare and branch
+register(Rule('slt_branch', 'SLT+Branches',
+              Inst(('slt', 'sltu', 'slti', 'sltiu'), operands=3),
+              Inst(('beqz', 'bnez'), operands=2),
+              same=[(0, 0)], default=False))
+
+
+class Dispatch(object):
+
+    def __init__(self, rules, mnemonics):
+        self.rules = rules
+        # first mnemonic id -> [(rule number, rule, ids the second may have)]
+        self.table = {}
+        for (n, rule) in enumerate(rules):
+            second_ids = frozenset(i for (i, m) in enumerate(mnemonics)
+                                   if rule.second.accepts_mnemonic(m))
+            for (i, m) in enumerate(mnemonics):
+                if rule.first.accepts_mnemonic(m):
+                    self.table.setdefault(i, []).append((n, rule, second_ids))
+        self.first_ids = np.array(sorted(self.table), dtype=np.int32)
+
+    # numbers of the rules that the instructions at row1, row2 match
+    def match(self, row1, row2, index):
+        entries = self.table.get(int(index.mnemonic_ids[row1]))
+        if not entries:
+            return []
+        mid2 = int(index.mnemonic_ids[row2])
+        ops1 = index.operand_list(row1)
+        ops2 = index.operand_list(row2)
+        return [n for (n, rule, second_ids) in entries
+                if mid2 in second_ids and rule.matches(ops1, ops2)]
+
+
+# dispatch table for rules over the mnemonics of one objdump index
+def compile_rules(rules, mnemonics):
+    return Dispatch(rules, mnemonics)
@@ -6,9 +6,13 @@ import matplotlib
 matplotlib.use('PDF') # must be called immediately, and before import pylab
                       # sets the back-end for matplotlib
 import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
 import pylab
 import optparse
+import cdf
+import filecache
+import histogram
 
 DIR="data-riscv64gc-o3-strict-aliasing"
 full_bmarks=["400.perlbench", "401.bzip2", "403.gcc", "429.mcf", "445.gobmk", "456.hmmer", "458.sjeng", "462.libquantum", "464.h264ref", "471.omnetpp", "473.astar", "483.xalancbmk"]
@@ -16,6 +20,11 @@ full_bmarks=["400.perlbench", "401.bzip2", "403.gcc", "429.mcf", "445.gobmk", "4
 bmarks=["perlbench", "bzip2", "gcc", "mcf", "gobmk", "hmmer", "sjeng", "libquantum", "h264ref", "omnetpp", "astar", "xalancbmk"]
 num_workloads=[3,6,9,1,5,2,1,1,3,1,2,1]
 FAST=False
+# how many of the hottest PCs each plot shows, and so how many each CDF keeps
+NUM_PLOT_POINTS=100
+NUM_CDF_POINTS=NUM_PLOT_POINTS
+# bump whenever reduce_workload's output changes, to invalidate old caches
+CDF_CACHE_VERSION=1
 
      
 cmap = matplotlib.pyplot.get_cmap("viridis_r")
@@ -38,7 +47,7 @@ def geomean(nums):
 
 def plot_cdf(plotter, bname, cdf, boundaries, idx, work_id, max_work):
     plt.title(bname, y=0.95)
-    num_points = 100
+    num_points = NUM_PLOT_POINTS
     plotter.plot(range(0,num_points), cdf[:num_points], color=getColor(work_id, max_work)) #, marker='.' )
     plotter.set_ylabel("CDF %")
     plotter.xaxis.labelpad = 1 
@@ -71,18 +80,98 @@ def find_pc_boundaries(freq_pc_pairs, size):
     last_pc = 0
     i = 0
     boundaries = []
-    for freq, pc_str in freq_pc_pairs[:size]:
-        pc = int(pc_str, 16)
-        #print "%s = %d" % (pc_str, pc)
+    for freq, pc in freq_pc_pairs[:size]:
+        #print "%x = %d" % (pc, pc)
         if last_pc - 4 != pc and last_pc - 2 != pc:
-            #print "Found Boundary at (%d), pc=0x%s" % (i, pc_str)
-            boundaries.append((i, pc_str))
+            #print "Found Boundary at (%d), pc=0x%x" % (i, pc)
+            boundaries.append((i, pc))
         last_pc = pc
         i += 1
     return boundaries
-            
+
+
+# the CDF (in percent, before each entry) over the hottest NUM_CDF_POINTS PCs
+# of a histogram, and where the PCs in that ranking stop being contiguous.
+# The histogram is streamed, keeping only the hottest entries seen so far.
+def reduce_workload(fname):
+    (total_insts, top_pcs, top_counts) = cdf.stream_top_k(histogram.iter_histogram(fname),
+                                                          NUM_CDF_POINTS)
+
+    freq_pc_pairs = zip(top_counts.tolist(), top_pcs.tolist())
+    num_to_print = len(freq_pc_pairs)
+    percents = 100.*top_counts/total_insts
+    cdf_array = np.concatenate(([0.], np.cumsum(percents)))[:num_to_print]
+
+    boundaries = find_pc_boundaries(freq_pc_pairs, num_to_print)
+    return (cdf_array, boundaries)
+
+
+def cache_file(fname):
+    return fname + ".cdf"
+
+
+def load_reduction(fname):
+    cached = filecache.load(cache_file(fname), fname)
+    if cached is None:
+        return None
+    (arrays, meta) = cached
+    if meta.get('version') != CDF_CACHE_VERSION or meta.get('points') != NUM_CDF_POINTS:
+        return None
+    boundaries = zip(arrays['boundary_idx'].tolist(), arrays['boundary_pc'].tolist())
+    return (np.array(arrays['cdf']), boundaries)
+
+
+# reduce_workload, memoized next to the histogram; runs in the worker pool
+def reduce_and_cache(fname):
+    (cdf_array, boundaries) = reduce_workload(fname)
+    arrays = {'cdf': cdf_array,
+              'boundary_idx': np.array([i for (i, pc) in boundaries], dtype=np.int64),
+              'boundary_pc': np.array([pc for (i, pc) in boundaries], dtype=np.uint64)}
+    try:
+        filecache.save(cache_file(fname), fname, arrays,
+                       {'version': CDF_CACHE_VERSION, 'points': NUM_CDF_POINTS})
+    except (IOError, OSError):
+        pass
+    return (cdf_array, boundaries)
+
+
+# fname -> (cdf_array, boundaries) for every workload; the ones without a
+# fresh cache are reduced in a process pool
+def load_workloads(fnames, jobs, use_cache=True):
+    reductions = {}
+    if use_cache:
+        for fname in fnames:
+            r = load_reduction(fname)
+            if r is not None:
+                reductions[fname] = r
+    missing = [f for f in fnames if f not in reductions]
+    if missing:
+        print "Reducing %d histograms (%d cached)" % (len(missing), len(reductions))
+        if jobs > 1 and len(missing) > 1:
+            pool = multiprocessing.Pool(min(jobs, len(missing)))
+            results = pool.map(reduce_and_cache, missing, chunksize=1)
+            pool.close()
+            pool.join()
+        else:
+            results = map(reduce_and_cache, missing)
+        reductions.update(zip(missing, results))
+    return reductions
+
         
 def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='number of processes reducing histograms [default: %default]')
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True,
+                    help='re-reduce every histogram instead of using its .cdf cache')
+    (options, args) = parser.parse_args()
+
+    fnames = []
+    for (bname, n) in zip(bmarks, num_workloads):
+        for w in range(1 if FAST else n):
+            fnames.append("./" + DIR + "/" + bname + "." + str(w) + ".err")
+    reductions = load_workloads(fnames, options.jobs, options.cache)
 
     # Plotting
     fig = plt.figure(figsize=(7.2,2.5))
@@ -115,36 +204,11 @@ def main():
             fname = "./" + DIR + "/" + bname + "." + str(w) + ".err"
             print "Opening: ", fname
              
-            # sanitize for header, footer
-            f = open(fname)
-            lines = map(lambda l: l.split(), f.readlines()[1:-4])
-
-            freq_pc_pairs = map(lambda l: (int(l[1]), l[0]), lines)
-            total_insts = sum(map(lambda p: p[0], freq_pc_pairs))
-
-#            print "Total Instructions: ", total_insts
-
-            freq_pc_pairs.sort(reverse=True)
-            cdf_sum = 0.
-            i = 0
-            num_to_print = len(freq_pc_pairs)
-            if num_to_print > 1000:
-                num_to_print = 1000
-#            print "num_to_print:", num_to_print
-            cdf_array = [None] * num_to_print
-            for freq, pc in freq_pc_pairs[:num_to_print]:
-                percent = 100.*freq/total_insts
-                cdf_array[i] = cdf_sum
-                i += 1
-                cdf_sum += percent
-    #            print '%8s %12u %8.3f%% %8.3f%%' % (pc, freq, percent, cdf_sum)
-    #        print 'Total:%15u' % total_insts
+            (cdf_array, boundaries) = reductions[fname]
 
             # Plotting
-#            print "Computing Boundaries"
-            boundaries = []
-            if not FAST:
-                boundaries = find_pc_boundaries(freq_pc_pairs, num_to_print)
+            if FAST:
+                boundaries = []
 #            print "Plotting CDF"
             plot_cdf(p, full_bmarks[x-1], cdf_array, boundaries, x, w, num_workloads[x-1])
             if FAST:
@@ -10,29 +10,34 @@ import numpy as np
 import pylab
 import optparse
 import sys
+import results
 
 
-# Total Dynamic Bytes (-O3)
-dynamic_bytes_data = {
-'RV64G': (9787613009464,12026619976548,5253213290312,1107296497700,7787857542508,11716023911916,11489441645752,5462366668348,19365586110024,2314291041560,3747678114072,3961024942240),
-'RV64GC':(7386771139900,9271905473172,3660416381884,831532911966,5787043439752,9361603319380,8423706802132,3942470355212,15422983070704,1625889380786,2977073689630,2911038273534),
-'ARMv7': (9744762652972,9363084560380,4986396938104,1402608533080,7845317433440,14660726284368,10856135253016,9097960465448,13762176079688,2396927292560,4456937953472,4077539159464),
-'ARMv8': (8919750364756, 9356368676660, 3757329928944, 1200100321484, 7250582939124,12229715680908,9976458458776,6250954278068,13431433283368,2177450043276,3990424119164,3625451990696),
-'x86-64':(8040307629188,8733495095292,3567018301833,998734650367,6643187200833,10370565659370,9156256088675,4798161091073,12024400475495,2047824858499,3643490730307,3182591006165)
+# the series each figure plots: label -> (isa, metric) in the results store
+# (see results.py), under the config picked with --config
+dynamic_bytes_series = {
+'RV64G':  ('RV64G',  'total_bytes'),
+'RV64GC': ('RV64GC', 'total_bytes'),
+'ARMv7':  ('ARMv7',  'total_bytes'),
+'ARMv8':  ('ARMv8',  'total_bytes'),
+'x86-64': ('x86-64', 'total_bytes')
 }
 
-# total instructions -O3 (or micro-ops, or macro-ops)
-total_insts_data = {
-    'RV64G':            (2446903252366,3006654994137,1313303322578,276824124425,1946964385627,2929005977979,2872360411438,1365591667087,4841396527506,578572760390, 936919528518, 990256235560),
-    'RV64GC macro-ops': (2373911481082,2441457750229,1294339550838,274916193763,1823132123900,2927888717150,2588246109084,1365357825233,4303734258211,569565919499, 848099712976, 988293691002),
-    'ARMv7':            (2436190663243,2340771140095,1246599234526,350652133270,1961329358360,3665181571092,2714033813254,2274490116362,3440544019922,599231823140,1114234488368,1019384789866),
-    'ARMv8':            (2229937591189,2339092169165,939332482236, 300025080371,1812645734781,3057428920227,2494114614694,1562738569517,3357858320842,544362510819, 997606029791, 906362997674),
-    'ARMv8 micro-ops':  (2280667418788,2481789456379,941892402104, 310104773044,1845509210612,3213026192094,2498446001612,1580783037916,3495334680450,600492779754,1043421150868, 960530017021),
-    'ia32':             (2170912961726,2372920217432, 997123972225,315737725906,1651569080869,2996165622128,2359380480175,2675016034413,3054004230248,661726492091,1055630710617, 951684494860),
-    'x86-64':           (2091432249933,2260212572889, 963603237022,294173914876,1645784489833,2525716510935,2223233518226,1649060223079,2952759491576,553138169594, 949003395478, 863957172176),
-    'x86-64 micro-ops': (2367182896653,2523738832163,1143066194842,305190626911,1825446671900,3700686618705,2376142609898,1454756704714,4348889582573,687664996934, 989392918261, 926067856035)
+# total instructions (or micro-ops, or macro-ops)
+total_insts_series = {
+    'RV64G':            ('RV64G',  'total_insts'),
+    'RV64GC macro-ops': ('RV64GC', 'total_macroops'),
+    'ARMv7':            ('ARMv7',  'total_insts'),
+    'ARMv8':            ('ARMv8',  'total_insts'),
+    'ARMv8 micro-ops':  ('ARMv8',  'total_uops'),
+    'ia32':             ('ia32',   'total_insts'),
+    'x86-64':           ('x86-64', 'total_insts'),
+    'x86-64 micro-ops': ('x86-64', 'total_uops')
 }
 
+# filled in from the results store by load_data()
+dynamic_bytes_data = {}
+total_insts_data = {}
 
 
 bmarks=["400.perlbench", "401.bzip2", "403.gcc", "429.mcf", "445.gobmk", "456.hmmer", "458.sjeng", "462.libquantum", "464.h264ref", "471.omnetpp", "473.astar", "483.xalancbmk"]
@@ -57,6 +62,13 @@ def getColor(idx):
 def geomean(nums):
     return (reduce(lambda x, y: x*y, nums))**(1.0/len(nums))
 
+# one tuple per series label, in bmarks order
+def load_data(db, config):
+    for (data, series) in ((dynamic_bytes_data, dynamic_bytes_series),
+                           (total_insts_data, total_insts_series)):
+        for (label, (isa, metric)) in series.items():
+            data[label] = results.series(db, isa, metric, config, bmarks)
+
 def plot_dynamic_bytes(plotter):
     plt.title("Total Dynamic Bytes", fontsize=9)
 
@@ -184,6 +196,20 @@ def plot_inst_counts_geomean(plotter):
           
      
 def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--db', dest='db', default=results.DEFAULT_DB,
+                    help='results database to plot from [default: %default]')
+    parser.add_option('--config', dest='config', default='o3',
+                    help='compiler config to plot [default: %default]')
+    (options, args) = parser.parse_args()
+
+    db = results.open_store(options.db)
+    try:
+        load_data(db, options.config)
+    except KeyError, e:
+        parser.error('%s in %s; record it with fused_ops_analysis.py --db or results.py import' %
+                     (e.args[0], options.db))
+    db.close()
 
     # Plotting
  
@@ -0,0 +1,416 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Shared reader for PC histograms.
+#
+# A histogram file (from the Pin tool or a simulator's stderr) looks like:
+#
+#   PC Histogram size:<number of PCs>
+#   <pc in hex> <times executed>
+#   ...
+#   # eof of Pin Trace File
+#
+# Simulator dumps may carry other lines before the header and after the
+# footer, so instead of slicing off a fixed number of lines we stream the file,
+# take the records after the header, and stop at the first '#' line after
+# them. Without a header, the records before the first '#' line after them
+# are the histogram; those are only known to be data once the input ends.
+#
+# The Pin tool can also write a binary histogram (-format bin):
+#
+#   8 bytes   magic "PCHISTB1"
+#   8 bytes   number of records
+#   records   (u64 pc, u64 count), sorted by pc
+#
+# with everything little-endian. Those are memory-mapped, not parsed.
+#
+# With -interval the Pin tool also appends a delta histogram every N
+# instructions to "<trace>.intervals". A text intervals file is a series of
+# histograms, each preceded by "# interval <n> thread <tid> instructions <n>"
+# and finished with "# end of intervals"; a binary one is just binary
+# histograms back to back. iter_intervals() reads either, and can follow a
+# text file that the Pin tool is still writing.
+#
+# Histograms are returned as a pair of compact numpy arrays (pcs, counts), in
+# file order, so nothing ever holds a python object per PC.
+#
+# merge_histograms() sums any number of PC-sorted histograms (as the Pin tool
+# writes them) with a streaming k-way merge, and write_histogram() writes the
+# result back out in either format.
+#
+# A histogram can also be read from stdin ('-') or a named pipe while the
+# simulator or the Pin tool is still writing it, in either format. It is
+# parsed as its lines arrive and read only once. Whatever the writer sends
+# after the histogram is drained at exit, after the results are out, so the
+# writer never sees a closed pipe.
+
+import atexit
+import os
+import stat
+import sys
+import time
+
+import numpy as np
+
+HEADER = 'PC Histogram size:'
+FOOTER = '#'
+CHUNK_SIZE = 1 << 16
+
+INTERVAL = '# interval'
+INTERVALS_END = '# end of intervals'
+
+BINARY_MAGIC = 'PCHISTB1'
+BINARY_HEADER = np.dtype([('magic', 'S8'), ('size', '<u8')])
+BINARY_RECORD = np.dtype([('pc', '<u8'), ('count', '<u8')])
+
+# room reserved in a text header for a size only known once written
+SIZE_WIDTH = 20
+
+STDIN = '-'
+
+
+def open_histogram(filename):
+    if filename == STDIN:
+        return sys.stdin
+    return open(filename)
+
+
+# is filename read as it is written: stdin or a named pipe?
+def is_stream(filename):
+    return filename == STDIN or stat.S_ISFIFO(os.stat(filename).st_mode)
+
+
+def is_binary(filename):
+    f = open(filename, 'rb')
+    magic = f.read(len(BINARY_MAGIC))
+    f.close()
+    return magic == BINARY_MAGIC
+
+
+# map the binary histogram at offset as a structured array of BINARY_RECORDs
+def map_binary(filename, offset=0):
+    header = np.memmap(filename, dtype=BINARY_HEADER, mode='r', offset=offset, shape=(1,))
+    if header['magic'][0] != BINARY_MAGIC:
+        raise ValueError('%s is not a binary PC histogram' % filename)
+    size = int(header['size'][0])
+    if size == 0:
+        return np.zeros(0, dtype=BINARY_RECORD)
+    return np.memmap(filename, dtype=BINARY_RECORD, mode='r',
+                     offset=offset + BINARY_HEADER.itemsize, shape=(size,))
+
+
+# returns the PC and count of a histogram line, or None if it isn't a record
+def parse_record(line):
+    bits = line.split()
+    if len(bits) != 2:
+        return None
+    try:
+        return (int(bits[0], 16), int(bits[1]))
+    except ValueError:
+        return None
+
+
+# yield (pcs, counts) arrays of at most chunk_size records, reading the file
+# (or any iterator over its lines) one line at a time. Pass in_data if the
+# header line has already been consumed. Anything that looks like a record
+# before the header is ignored, unless there is no header at all.
+def iter_chunks(f, chunk_size=CHUNK_SIZE, in_data=False):
+    pcs = []
+    counts = []
+    # chunks of records before any header, and whether a '#' line followed
+    # them
+    early = []
+    early_done = False
+    for line in f:
+        if line.startswith(HEADER):
+            in_data = True
+            pcs = []
+            counts = []
+            early = []
+            continue
+        if line.startswith(FOOTER):
+            if in_data:
+                break
+            early_done = early_done or bool(early or pcs)
+            continue
+        rec = parse_record(line)
+        if rec is None or (early_done and not in_data):
+            continue
+        pcs.append(rec[0])
+        counts.append(rec[1])
+        if len(pcs) >= chunk_size:
+            chunk = (np.array(pcs, dtype=np.uint64), np.array(counts, dtype=np.uint64))
+            if in_data:
+                yield chunk
+            else:
+                early.append(chunk)
+            pcs = []
+            counts = []
+    if not in_data:
+        for chunk in early:
+            yield chunk
+    if pcs:
+        yield (np.array(pcs, dtype=np.uint64), np.array(counts, dtype=np.uint64))
+
+
+def concat_chunks(chunks):
+    if not chunks:
+        return (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64))
+    if len(chunks) == 1:
+        return chunks[0]
+    pcs = np.concatenate([c[0] for c in chunks])
+    counts = np.concatenate([c[1] for c in chunks])
+    return (pcs, counts)
+
+
+# returns (pcs, counts) as uint64 arrays, in file order
+def load_histogram(filename):
+    if is_stream(filename):
+        return concat_chunks(list(iter_stream(filename)))
+    if is_binary(filename):
+        records = map_binary(filename)
+        return (records['pc'], records['count'])
+    f = open_histogram(filename)
+    chunks = list(iter_chunks(f))
+    f.close()
+    return concat_chunks(chunks)
+
+
+# yield (pcs, counts) chunks of a histogram in file order without ever
+# holding the whole of it: slices of the mapping for binary files, parsed
+# chunks for text ones
+def iter_histogram(filename, chunk_size=CHUNK_SIZE):
+    if is_stream(filename):
+        for chunk in iter_stream(filename, chunk_size):
+            yield chunk
+        return
+    if is_binary(filename):
+        records = map_binary(filename)
+        for start in xrange(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            yield (chunk['pc'], chunk['count'])
+        return
+    f = open_histogram(filename)
+    for chunk in iter_chunks(f, chunk_size):
+        yield chunk
+    f.close()
+
+
+# streams still open, to be drained at exit
+_streams = []
+
+
+# yield (pcs, counts) chunks of a histogram from stdin or a named pipe as the
+# writer sends them
+def iter_stream(filename, chunk_size=CHUNK_SIZE):
+    f = open_histogram(filename)
+    _streams.append(f)
+    magic = f.read(len(BINARY_MAGIC))
+    if magic != BINARY_MAGIC:
+        for chunk in iter_chunks(stream_lines(f, magic), chunk_size):
+            yield chunk
+        return
+    size = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+    while size:
+        n = min(size, chunk_size)
+        buf = f.read(n * BINARY_RECORD.itemsize)
+        if len(buf) < n * BINARY_RECORD.itemsize:
+            raise ValueError('%s ended in the middle of a binary histogram' % filename)
+        records = np.frombuffer(buf, dtype=BINARY_RECORD)
+        yield (records['pc'], records['count'])
+        size -= n
+
+
+# the lines of f, each as soon as it is complete, after those of pending
+# (text already read). Iterating over a file in python 2 reads ahead, which
+# would hold back lines that have already arrived.
+def stream_lines(f, pending=''):
+    while True:
+        if '\n' in pending:
+            (line, pending) = pending.split('\n', 1)
+            yield line + '\n'
+            continue
+        more = f.readline()
+        if not more:
+            if pending:
+                yield pending
+            return
+        pending += more
+
+
+# read the streams to their end, once the results are out
+def _drain_streams():
+    try:
+        sys.stdout.flush()
+        for f in _streams:
+            if not f.closed and not f.isatty():
+                while f.read(1 << 16):
+                    pass
+    except (IOError, KeyboardInterrupt):
+        pass
+
+atexit.register(_drain_streams)
+
+
+# like iterating over f, but waits for more lines at the end of the file
+# instead of stopping, for files that are still being written
+def follow_lines(f, poll=1.0):
+    partial = ''
+    while True:
+        line = f.readline()
+        if not line:
+            time.sleep(poll)
+            continue
+        partial += line
+        if partial.endswith('\n'):
+            yield partial
+            partial = ''
+
+
+# yield (info, pcs, counts) for every interval of an intervals file. info
+# holds the fields of the "# interval" line (interval, thread, instructions);
+# binary files don't record the thread. With follow, wait for the
+# Pin tool to write more intervals until it finishes the file.
+def iter_intervals(filename, follow=False, poll=1.0):
+    if not is_stream(filename) and is_binary(filename):
+        size = os.path.getsize(filename)
+        offset = 0
+        interval = 0
+        while offset < size:
+            records = map_binary(filename, offset)
+            info = {'interval': interval, 'instructions': int(records['count'].sum())}
+            yield (info, records['pc'], records['count'])
+            offset += BINARY_HEADER.itemsize + records.nbytes
+            interval += 1
+        return
+
+    f = open_histogram(filename)
+    if is_stream(filename):
+        _streams.append(f)
+        lines = stream_lines(f)
+    elif follow:
+        lines = follow_lines(f, poll)
+    else:
+        lines = iter(f)
+    info = {}
+    for line in lines:
+        if line.startswith(INTERVALS_END):
+            break
+        if line.startswith(INTERVAL):
+            bits = line[1:].split()
+            info = dict(zip(bits[0::2], [int(b) for b in bits[1::2]]))
+        elif line.startswith(HEADER):
+            (pcs, counts) = concat_chunks(list(iter_chunks(lines, in_data=True)))
+            if 'instructions' not in info:
+                info['instructions'] = int(counts.sum())
+            yield (info, pcs, counts)
+            info = {}
+    if f not in _streams:
+        f.close()
+
+
+# join PC-sorted histograms, each given as an iterator of (pcs, counts)
+# chunks (e.g. iter_histogram()), on PC. Yields (pcs, columns) chunks in PC
+# order, where columns[i] holds input i's count of each of pcs (0 where it
+# doesn't have that PC), while holding about one chunk per input.
+def join_histograms(streams):
+    streams = [iter(stream) for stream in streams]
+    last_pcs = [None] * len(streams)
+
+    # the input's next non-empty chunk, or None once it's done
+    def refill(i):
+        for (pcs, counts) in streams[i]:
+            if not len(pcs):
+                continue
+            pcs = np.asarray(pcs, dtype=np.uint64)
+            if np.any(pcs[1:] < pcs[:-1]) or (last_pcs[i] is not None and pcs[0] < last_pcs[i]):
+                raise ValueError('histogram %d is not sorted by PC' % i)
+            last_pcs[i] = pcs[-1]
+            return (pcs, np.asarray(counts, dtype=np.uint64))
+        return None
+
+    buffers = [refill(i) for i in range(len(streams))]
+    while True:
+        live = [i for i in range(len(streams)) if buffers[i] is not None]
+        if not live:
+            return
+        # every PC up to the smallest of the buffers' last PCs is complete
+        bound = min(buffers[i][0][-1] for i in live)
+        parts = [None] * len(streams)
+        for i in live:
+            (buf_pcs, buf_counts) = buffers[i]
+            n = int(buf_pcs.searchsorted(bound, side='right'))
+            parts[i] = _sum_repeats(buf_pcs[:n], buf_counts[:n])
+            if n == len(buf_pcs):
+                buffers[i] = refill(i)
+            else:
+                buffers[i] = (buf_pcs[n:], buf_counts[n:])
+        pcs = np.unique(np.concatenate([parts[i][0] for i in live]))
+        columns = []
+        for part in parts:
+            column = np.zeros(len(pcs), dtype=np.uint64)
+            if part is not None:
+                column[pcs.searchsorted(part[0])] = part[1]
+            columns.append(column)
+        yield (pcs, columns)
+
+
+# a sorted chunk with every repeated PC's counts summed
+def _sum_repeats(pcs, counts):
+    if not np.any(pcs[1:] == pcs[:-1]):
+        return (pcs, counts)
+    starts = np.concatenate(([0], np.nonzero(pcs[1:] != pcs[:-1])[0] + 1))
+    return (pcs[starts], np.add.reduceat(counts, starts))
+
+
+# sum PC-sorted histograms, each given as an iterator of (pcs, counts) chunks
+# (e.g. iter_histogram()), optionally scaling each one by a weight. Yields
+# the sum as (pcs, counts) chunks in PC order while holding about one chunk
+# per input. Fractional weights round the summed counts to the nearest
+# integer.
+def merge_histograms(streams, weights=None):
+    streams = list(streams)
+    if weights is None:
+        weights = [1] * len(streams)
+    exact = all(float(w) == int(w) for w in weights)
+    for (pcs, columns) in join_histograms(streams):
+        if exact:
+            summed = np.zeros(len(pcs), dtype=np.uint64)
+            for (w, column) in zip(weights, columns):
+                summed += column * np.uint64(int(w))
+        else:
+            summed = np.zeros(len(pcs), dtype=np.float64)
+            for (w, column) in zip(weights, columns):
+                summed += column.astype(np.float64) * float(w)
+            summed = np.rint(summed).astype(np.uint64)
+        yield (pcs, summed)
+
+
+# write (pcs, counts) chunks to filename as a text or binary histogram;
+# returns the number of PCs written. The text header's size is filled in at
+# the end, so it is padded with spaces.
+def write_histogram(filename, chunks, binary=False):
+    f = open(filename, 'wb')
+    if binary:
+        f.write(BINARY_MAGIC + '\0' * 8)
+    else:
+        f.write(HEADER + ' ' * SIZE_WIDTH + '\n')
+    size = 0
+    for (pcs, counts) in chunks:
+        if binary:
+            records = np.empty(len(pcs), dtype=BINARY_RECORD)
+            records['pc'] = pcs
+            records['count'] = counts
+            f.write(records.tostring())
+        else:
+            f.write(''.join(['%x %d\n' % r for r in zip(pcs.tolist(), counts.tolist())]))
+        size += len(pcs)
+    if binary:
+        f.seek(len(BINARY_MAGIC))
+        f.write(np.array([size], dtype='<u8').tostring())
+    else:
+        f.write('# eof of Pin Trace File\n')
+        f.seek(len(HEADER))
+        f.write(str(size))
+    f.close()
+    return size
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - an intervals file from the Pin tool (pintool_histogram.cpp -interval N)
+#   - (optionally) an objdump file, for real instruction sizes
+#
+# OUTPUT:
+#   - for every interval, how many PCs it takes to reach a CDF threshold and
+#     the hottest code segments inside that CDF, so program phases show up
+#     instead of being averaged into one histogram
+#
+# With --follow the file is read as the Pin tool writes it.
+
+import optparse
+import numpy as np
+import cdf
+import histogram
+import objdump
+import regions
+
+
+def analyze_interval(info, pcs, counts, max_cdf, num_segments, index):
+    ranking = cdf.Ranking(pcs, counts)
+    total = ranking.total
+    if not total:
+        return
+    num_hot = ranking.count_to_cdf(max_cdf)
+    hot = ranking.top(num_hot)
+
+    print "Interval %5d thread %3s: %14u insts, %9d PCs, %7d PCs for %5.1f%% CDF" % \
+        (info.get('interval', -1), info.get('thread', '-'), total, len(pcs), num_hot, max_cdf)
+
+    sizes = None
+    if index is not None:
+        rows = index.rows(pcs[hot])
+        sizes = np.where(rows >= 0, index.sizes[rows], 4).astype(np.uint64)
+    segments = regions.Regions(pcs[hot], counts[hot], sizes)
+    for s in segments.top(num_segments):
+        print "    %12x-%-12x (%5d instructions) %8.3f%%" % \
+            (segments.start_pc(s), segments.end_pc(s), segments.num_insts(s),
+             100.*segments.count(s)/total)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-f', '--intervals', dest='intervals_file',
+                    help='input intervals file')
+    parser.add_option('-d', '--objdump', dest='objdump_file',
+                    help='input objdump file (optional)')
+    parser.add_option('-n', '--cdf', dest='cdf',
+                    help='CDF of the hottest PCs to analyze per interval', default=90)
+    parser.add_option('-s', '--segments', dest='segments',
+                    help='number of hot segments to print per interval', default=5)
+    parser.add_option('--follow', dest='follow', action='store_true', default=False,
+                    help='keep reading as the Pin tool appends intervals')
+    (options, args) = parser.parse_args()
+    if not options.intervals_file:
+        parser.error('Please give an input filename with -f')
+
+    index = None
+    if options.objdump_file:
+        index = objdump.load_objdump(options.objdump_file)
+
+    for (info, pcs, counts) in histogram.iter_intervals(options.intervals_file, options.follow):
+        analyze_interval(info, pcs, counts, float(options.cdf), int(options.segments), index)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - any number of PC histograms (text or binary, sorted by PC as the Pin
+#     tool writes them), e.g. one per workload of a benchmark
+#   - (optionally) a weight per histogram
+#
+# OUTPUT:
+#   - one histogram with the (weighted) sum of their counts, which every
+#     other script reads like any single run
+#
+# With --intervals, each input is an intervals file and all of its intervals
+# are merged.
+
+import optparse
+import numpy as np
+import histogram
+
+
+# the sum of every interval of an intervals file, as one (pcs, counts) chunk.
+# Each interval is PC-sorted on its own, but not against the others, so they
+# are concatenated, sorted by PC once and the counts of each PC summed.
+def sum_intervals(filename):
+    (pcs, counts) = histogram.concat_chunks([(pcs, counts) for (info, pcs, counts)
+                                             in histogram.iter_intervals(filename)])
+    if not len(pcs):
+        yield (pcs, counts)
+        return
+    order = np.argsort(pcs, kind='mergesort')
+    pcs = np.asarray(pcs)[order]
+    starts = np.concatenate(([0], np.nonzero(pcs[1:] != pcs[:-1])[0] + 1))
+    yield (pcs[starts], np.add.reduceat(np.asarray(counts, dtype=np.uint64)[order], starts))
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] histogram...')
+    parser.add_option('-o', '--output', dest='output_file',
+                    help='output histogram file')
+    parser.add_option('--format', dest='format', type='choice',
+                    choices=['text', 'bin'], default='text',
+                    help='output format: text or bin [default: %default]')
+    parser.add_option('-w', '--weights', dest='weights',
+                    help='comma-separated weight of every input (default: all 1)')
+    parser.add_option('--intervals', dest='intervals', action='store_true', default=False,
+                    help='the inputs are intervals files; merge all of their intervals')
+    (options, args) = parser.parse_args()
+    if not options.output_file or not args:
+        parser.error('Please give an output filename with -o and some input histograms')
+    weights = None
+    if options.weights:
+        try:
+            weights = [float(w) for w in options.weights.split(',')]
+        except ValueError:
+            parser.error('weights must be numbers: %s' % options.weights)
+        if len(weights) != len(args):
+            parser.error('got %d weights for %d histograms' % (len(weights), len(args)))
+
+    if options.intervals:
+        streams = [sum_intervals(filename) for filename in args]
+    else:
+        streams = [histogram.iter_histogram(filename) for filename in args]
+    try:
+        size = histogram.write_histogram(options.output_file,
+                                         histogram.merge_histograms(streams, weights),
+                                         options.format == 'bin')
+    except ValueError, e:
+        parser.error('%s (%s)' % (e, ', '.join(args)))
+    print "Merged %d histograms into %s (%d PCs)" % (len(args), options.output_file, size)
+
+
+if __name__ == '__main__':
+  main()
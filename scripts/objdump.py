@@ -0,0 +1,283 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Parsed index of an objdump file.
+#
+# Every "<pc>:\t<bytes>\t<mnemonic>\t<operands>" line becomes one row of a few
+# columnar arrays sorted by PC:
+#
+#   pcs          - uint64 PC of the line
+#   sizes        - uint8 size of the instruction in bytes
+#   mnemonic_ids - index into the interned mnemonics table
+#   operand_ids  - index into the interned operands table (operands are stored
+#                  already split on ',')
+#
+# x86 objdump wraps long encodings onto continuation lines (7 bytes per line)
+# that only have bytes; those are folded into the size of the instruction they
+# continue, so every row is a whole instruction. Mnemonic id 0 is the empty
+# mnemonic.
+#
+# Every "<addr> <symbol>:" label line starts a function. Functions are kept as
+# sorted (start, end) address ranges, where end is just past the function's
+# last instruction, so PCs are mapped to functions with a searchsorted.
+#
+# load_objdump() keeps the parsed index in a "<dump>.idx" sidecar (see
+# filecache.py), so later runs against the same binary just map the arrays
+# back in instead of re-tokenizing the dump.
+
+import numpy as np
+
+import filecache
+
+CACHE_SUFFIX = '.idx'
+CACHE_VERSION = 3
+
+
+class ObjdumpIndex(object):
+
+    def __init__(self, pcs, sizes, mnemonic_ids, operand_ids, mnemonics,
+                 operands, tab_separated=True, symbol_starts=None, symbol_ends=None,
+                 symbols=()):
+        self.pcs = pcs
+        self.sizes = sizes
+        self.mnemonic_ids = mnemonic_ids
+        self.operand_ids = operand_ids
+        self.mnemonics = mnemonics
+        self.operands = operands
+        # RISC-V/ARM objdump separate mnemonic and operands with a tab, x86
+        # pads the mnemonic with spaces
+        self.tab_separated = tab_separated
+        if symbol_starts is None:
+            symbol_starts = np.zeros(0, dtype=np.uint64)
+            symbol_ends = np.zeros(0, dtype=np.uint64)
+        self.symbol_starts = symbol_starts
+        self.symbol_ends = symbol_ends
+        self.symbols = list(symbols)
+
+    def __len__(self):
+        return len(self.pcs)
+
+    def __contains__(self, pc):
+        return self.row(pc) >= 0
+
+    # returns the row holding pc, or -1
+    def row(self, pc):
+        pc = np.uint64(pc)
+        i = int(self.pcs.searchsorted(pc))
+        if i < len(self.pcs) and self.pcs[i] == pc:
+            return i
+        return -1
+
+    # vectorized row(); -1 where a pc isn't in the objdump
+    def rows(self, pcs):
+        if not len(self.pcs):
+            return np.full(len(pcs), -1, dtype=np.int64)
+        i = self.pcs.searchsorted(pcs)
+        i[i == len(self.pcs)] = 0
+        return np.where(self.pcs[i] == pcs, i, -1)
+
+    def mnemonic(self, row):
+        return self.mnemonics[self.mnemonic_ids[row]]
+
+    def operand_list(self, row):
+        return self.operands[self.operand_ids[row]]
+
+    # vectorized: the function (index into symbols) each of pcs falls in, or -1
+    def functions(self, pcs):
+        f = self.symbol_starts.searchsorted(pcs, side='right').astype(np.int64) - 1
+        inside = f >= 0
+        inside[inside] = pcs[inside] < self.symbol_ends[f[inside]]
+        return np.where(inside, f, -1)
+
+    # the disassembly text after the encoding bytes, as objdump printed it
+    def text(self, row):
+        mnemonic = self.mnemonic(row)
+        operands = ','.join(self.operand_list(row))
+        if not operands:
+            return mnemonic
+        if self.tab_separated:
+            return mnemonic + '\t' + operands
+        return mnemonic.ljust(6) + ' ' + operands
+
+
+# the operands table as read back from a cache: one blob with a '\n' after
+# every entry, split on demand
+class OperandTable(object):
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        self.decoded = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        ops = self.decoded.get(i)
+        if ops is None:
+            text = self.blob[int(self.offsets[i]):int(self.offsets[i+1]) - 1].tostring()
+            ops = tuple(text.split(',')) if text else ()
+            self.decoded[i] = ops
+        return ops
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+def _intern(table, ids, key):
+    i = ids.get(key)
+    if i is None:
+        i = len(table)
+        ids[key] = i
+        table.append(key)
+    return i
+
+
+def parse_objdump(filename):
+    pcs = []
+    sizes = []
+    mnemonic_ids = []
+    operand_ids = []
+    mnemonics = ['']
+    mnemonic_map = {'': 0}
+    operands = [()]
+    operand_map = {(): 0}
+    tab_separated = False
+    labels = []
+
+    d = open(filename)
+    for l in d:
+        if ':\t' not in l:
+            label = _parse_label(l)
+            if label is not None:
+                labels.append(label)
+            continue
+        (addr, rest) = l.strip().split(':\t', 1)
+        try:
+            pc = int(addr, 16)
+        except ValueError:
+            continue
+        fields = rest.split('\t')
+        bits = fields[0].split()
+        if not bits:
+            continue
+        size = sum([len(b) for b in bits]) / 2
+        mnemonic = ''
+        ops = ()
+        if len(fields) >= 3:
+            tab_separated = True
+            mnemonic = fields[1].strip()
+            ops = tuple('\t'.join(fields[2:]).split(','))
+        elif len(fields) == 2:
+            asm = fields[1].split(None, 1)
+            if asm:
+                mnemonic = asm[0]
+            if len(asm) == 2:
+                ops = tuple(asm[1].split(','))
+        if not mnemonic and len(fields) == 1:
+            # more bytes of the instruction on the line before
+            if pcs and pcs[-1] + sizes[-1] == pc:
+                sizes[-1] += size
+            continue
+        pcs.append(pc)
+        sizes.append(size)
+        mnemonic_ids.append(_intern(mnemonics, mnemonic_map, mnemonic))
+        operand_ids.append(_intern(operands, operand_map, ops))
+    d.close()
+
+    pcs = np.array(pcs, dtype=np.uint64)
+    order = np.argsort(pcs, kind='mergesort')
+    pcs = pcs[order]
+    sizes = np.array(sizes, dtype=np.uint8)[order]
+    (symbol_starts, symbol_ends, symbols) = _symbol_ranges(labels, pcs, sizes)
+    return ObjdumpIndex(pcs, sizes,
+                        np.array(mnemonic_ids, dtype=np.int32)[order],
+                        np.array(operand_ids, dtype=np.int32)[order],
+                        mnemonics, operands, tab_separated,
+                        symbol_starts, symbol_ends, symbols)
+
+
+# returns (address, symbol) of a "0000000000010078 <main>:" line, or None
+def _parse_label(line):
+    line = line.strip()
+    if not line.endswith('>:') or ' <' not in line:
+        return None
+    (addr, name) = line[:-2].split(' <', 1)
+    try:
+        return (int(addr, 16), name)
+    except ValueError:
+        return None
+
+
+# sorted function ranges from the label lines: each function runs up to the
+# end of the last instruction before the next label
+def _symbol_ranges(labels, pcs, sizes):
+    labels.sort(key=lambda label: label[0])
+    # aliases: keep the first name at each address
+    unique = []
+    for (addr, name) in labels:
+        if not unique or unique[-1][0] != addr:
+            unique.append((addr, name))
+    starts = np.array([addr for (addr, name) in unique], dtype=np.uint64)
+    names = [name for (addr, name) in unique]
+    if not len(starts):
+        return (starts, starts.copy(), names)
+    # the last row of each function: the row before the next function starts
+    nexts = np.concatenate((starts[1:], [np.iinfo(np.uint64).max])).astype(np.uint64)
+    last = pcs.searchsorted(nexts).astype(np.int64) - 1
+    last_pcs = pcs[np.maximum(last, 0)]
+    ends = np.where((last >= 0) & (last_pcs >= starts),
+                    last_pcs + sizes[np.maximum(last, 0)], starts).astype(np.uint64)
+    return (starts, ends, names)
+
+
+def save_cache(index, filename, cache_file):
+    texts = [','.join(ops) for ops in index.operands]
+    offsets = np.zeros(len(texts) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(t) + 1 for t in texts])
+    blob = np.frombuffer('\n'.join(texts) + '\n', dtype=np.uint8)
+    arrays = {'pcs': index.pcs,
+              'sizes': index.sizes,
+              'mnemonic_ids': index.mnemonic_ids,
+              'operand_ids': index.operand_ids,
+              'operand_blob': blob,
+              'operand_offsets': offsets,
+              'symbol_starts': index.symbol_starts,
+              'symbol_ends': index.symbol_ends}
+    meta = {'version': CACHE_VERSION,
+            'mnemonics': list(index.mnemonics),
+            'symbols': index.symbols,
+            'tab_separated': index.tab_separated}
+    filecache.save(cache_file, filename, arrays, meta)
+
+
+def load_cache(filename, cache_file):
+    cached = filecache.load(cache_file, filename)
+    if cached is None:
+        return None
+    (arrays, meta) = cached
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    operands = OperandTable(arrays['operand_blob'], arrays['operand_offsets'])
+    return ObjdumpIndex(arrays['pcs'], arrays['sizes'], arrays['mnemonic_ids'],
+                        arrays['operand_ids'], [str(m) for m in meta['mnemonics']],
+                        operands, meta['tab_separated'], arrays['symbol_starts'],
+                        arrays['symbol_ends'], [str(name) for name in meta['symbols']])
+
+
+# parse filename, or reuse its sidecar cache when it is still fresh
+def load_objdump(filename, cache=True):
+    if not cache:
+        return parse_objdump(filename)
+    cache_file = filename + CACHE_SUFFIX
+    index = load_cache(filename, cache_file)
+    if index is not None:
+        return index
+    index = parse_objdump(filename)
+    try:
+        save_cache(index, filename, cache_file)
+    except (IOError, OSError):
+        # read-only directory and the like; just run uncached
+        pass
+    return index
@@ -0,0 +1,166 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Instruction classes for the dynamic opcode mix, declared as data.
+#
+# A class lists the mnemonics that belong to it, exactly or by prefix or
+# suffix. A mnemonic belongs to the first class in CLASSES that accepts it, or
+# to 'other'. RVC mnemonics (c.addi, ...) are classified like their full-width
+# forms; the compressed/full-width split is by instruction size instead.
+#
+# Mnemonics are interned when the objdump is parsed (see objdump.py), so every
+# mnemonic is classified once, and every row's class is one lookup into the
+# mnemonic table. x86 moves are the exception: whether they load or store
+# depends on their operands (see row_classes()). So are x86 instructions with
+# a rep or lock prefix, which objdump prints as the mnemonic: those are
+# classified by the instruction after it (and a locked one is atomic).
+
+import numpy as np
+
+# x86 prefixes objdump prints in place of the mnemonic
+PREFIXES = ('rep', 'repz', 'repe', 'repnz', 'repne', 'lock')
+
+
+class OpClass(object):
+
+    def __init__(self, name, mnemonics=(), prefixes=(), suffixes=()):
+        self.name = name
+        self.mnemonics = frozenset(mnemonics)
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+
+    def accepts(self, mnemonic):
+        return mnemonic in self.mnemonics or \
+            (bool(self.prefixes) and mnemonic.startswith(self.prefixes)) or \
+            (bool(self.suffixes) and mnemonic.endswith(self.suffixes))
+
+
+CLASSES = []
+
+
+def register(op_class):
+    CLASSES.append(op_class)
+    return op_class
+
+
+# unconditional jumps, calls and returns
+register(OpClass('jump',
+                 ('j', 'jal', 'jalr', 'jr', 'ret', 'call', 'tail', 'mret', 'sret',
+                  'leave', 'leaveq'),
+                 prefixes=('jmp', 'call', 'ret')))
+
+register(OpClass('branch',
+                 ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu', 'beqz', 'bnez',
+                  'blez', 'bgez', 'bltz', 'bgtz', 'bgt', 'ble', 'bgtu', 'bleu',
+                  'loop', 'loope', 'loopne'),
+                 prefixes=('j',)))
+
+register(OpClass('atomic',
+                 ('lock', 'xadd', 'cmpxchg'),
+                 prefixes=('amo', 'lr.', 'sc.', 'cmpxchg')))
+
+# pops are listed exactly, as 'pop' also starts popcnt
+register(OpClass('load',
+                 ('lb', 'lbu', 'lh', 'lhu', 'lw', 'lwu', 'ld', 'flw', 'fld',
+                  'lwsp', 'ldsp', 'flwsp', 'fldsp',
+                  'pop', 'popq', 'popl', 'popw', 'popf', 'popfq', 'popfl', 'popfw',
+                  'popa', 'popal', 'popaw'),
+                 prefixes=('lods',)))
+
+register(OpClass('store',
+                 ('sb', 'sh', 'sw', 'sd', 'fsw', 'fsd',
+                  'swsp', 'sdsp', 'fswsp', 'fsdsp'),
+                 prefixes=('push', 'stos')))
+
+register(OpClass('system',
+                 ('ecall', 'ebreak', 'fence', 'fence.i', 'sfence.vma', 'wfi',
+                  'syscall', 'hlt', 'cpuid', 'rdtsc', 'ud2', 'int3'),
+                 prefixes=('csr',)))
+
+register(OpClass('nop', prefixes=('nop',)))
+
+# RISC-V F/D and x87 (f...), SSE scalar/packed (...ss, ...sd, ...ps, ...pd)
+register(OpClass('fp', prefixes=('f',), suffixes=('ss', 'sd', 'ps', 'pd')))
+
+register(OpClass('muldiv', prefixes=('mul', 'div', 'rem', 'imul', 'idiv')))
+
+register(OpClass('shift',
+                 prefixes=('sll', 'srl', 'sra', 'shl', 'shr', 'sar', 'sal',
+                           'rol', 'ror', 'rcl', 'rcr')))
+
+register(OpClass('move',
+                 ('mv', 'li', 'lui'),
+                 prefixes=('mov', 'cmov', 'xchg')))
+
+register(OpClass('alu',
+                 prefixes=('add', 'sub', 'and', 'or', 'xor', 'slt', 'neg', 'not',
+                           'sext', 'zext', 'seqz', 'snez', 'sltz', 'sgtz', 'auipc',
+                           'min', 'max', 'adc', 'sbb', 'cmp', 'test', 'lea', 'inc',
+                           'dec', 'set', 'clt', 'cqt', 'cwt', 'cdq', 'bt', 'bsf',
+                           'bsr', 'bswap', 'popcnt', 'lzcnt', 'tzcnt')))
+
+
+# class names, with 'other' last
+def class_names():
+    return [c.name for c in CLASSES] + ['other']
+
+
+def class_id(name):
+    return class_names().index(name)
+
+
+def classify(mnemonic):
+    if mnemonic.startswith('c.'):
+        mnemonic = mnemonic[2:]
+    for (i, c) in enumerate(CLASSES):
+        if c.accepts(mnemonic):
+            return i
+    return len(CLASSES)
+
+
+# the class id of every mnemonic id of an objdump index
+def mnemonic_classes(index):
+    return np.array([classify(m) for m in index.mnemonics], dtype=np.int32)
+
+
+# the class of each of rows. A rep- or lock-prefixed x86 instruction is
+# classified by the mnemonic that starts its operands. An x86 (AT&T) move
+# whose last operand is in memory is a store, and one that reads memory
+# otherwise is a load. Operands are stored split on ',', so a memory operand
+# ends with ')' and starts with something holding '('. objdump may append a
+# '# <address>' comment.
+def row_classes(index, rows):
+    mnemonic_ids = index.mnemonic_ids[rows]
+    classes = mnemonic_classes(index)[mnemonic_ids]
+    prefix_ids = [i for (i, m) in enumerate(index.mnemonics) if m in PREFIXES]
+    prefixed = np.in1d(mnemonic_ids, prefix_ids)
+    if prefixed.any():
+        # one lookup per (prefix, operands) that ran
+        keys = mnemonic_ids[prefixed].astype(np.int64) * len(index.operands) + \
+            index.operand_ids[rows][prefixed]
+        (unique_keys, inverse) = np.unique(keys, return_inverse=True)
+        inner = np.zeros(len(unique_keys), dtype=classes.dtype)
+        for (k, key) in enumerate(unique_keys.tolist()):
+            (prefix, ops) = divmod(key, len(index.operands))
+            words = index.operands[ops][0].split() if index.operands[ops] else []
+            if index.mnemonics[prefix] == 'lock':
+                inner[k] = class_id('atomic')
+            else:
+                inner[k] = classify(words[0] if words else '')
+        classes[prefixed] = inner[inverse]
+
+    move = class_id('move')
+    moves = classes == move
+    operand_ids = index.operand_ids[rows][moves]
+    # only the operands of the moves that ran are looked at
+    kinds = np.zeros(len(index.operands), dtype=np.int32)
+    for i in np.unique(operand_ids).tolist():
+        ops = index.operands[i]
+        if ops and ops[-1].split('#')[0].rstrip().endswith(')'):
+            kinds[i] = class_id('store')
+        elif ops and '(' in ops[0]:
+            kinds[i] = class_id('load')
+        else:
+            kinds[i] = move
+    classes[moves] = kinds[operand_ids]
+    return classes
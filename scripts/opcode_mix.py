@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - a histogram of PCs and times executed
+#   - an objdump file
+#
+# OUTPUT:
+#   - the dynamic instruction mix: instructions and bytes executed per class
+#     (loads, stores, branches, shifts, ...; see opcode_classes.py)
+#   - the same per instruction size (e.g. RVC vs. full-width)
+#   - (optionally) the most executed mnemonics
+
+import optparse
+import numpy as np
+import histogram
+import objdump
+import opcode_classes
+import profiling
+
+
+# dynamic (instructions, bytes) per class, per instruction size and per
+# mnemonic, plus the instructions that aren't in the objdump. Each is one
+# bincount over the histogram's rows.
+def opcode_mix(index, pcs, counts):
+    rows = index.rows(pcs)
+    found = rows >= 0
+    not_in_program = int(counts[~found].sum())
+    rows = rows[found]
+    counts = counts[found]
+    sizes = index.sizes[rows]
+    nbytes = counts * sizes.astype(np.uint64)
+
+    def reduce_by(keys, nbins):
+        return (np.bincount(keys, weights=counts, minlength=nbins).astype(np.uint64),
+                np.bincount(keys, weights=nbytes, minlength=nbins).astype(np.uint64))
+
+    classes = opcode_classes.row_classes(index, rows)
+    return {'classes': reduce_by(classes, len(opcode_classes.class_names())),
+           'sizes': reduce_by(sizes, 16),
+           'mnemonics': reduce_by(index.mnemonic_ids[rows], len(index.mnemonics)),
+           'not_in_program': not_in_program}
+
+
+def print_table(title, names, insts, nbytes, total_insts):
+    print '%-12s %14s %8s %14s %6s' % (title, 'insts', 'percent', 'bytes', 'avg')
+    for (name, n, b) in zip(names, insts, nbytes):
+        print '%-12s %14u %7.3f%% %14u %6.3f' % \
+            (name, n, 100.*n/total_insts, b, float(b)/n)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-f', '--histogram', dest='histogram_file',
+                    help='input histogram file')
+    parser.add_option('-d', '--objdump', dest='objdump_file',
+                    help='input objdump file')
+    parser.add_option('-m', '--mnemonics', dest='mnemonics', default=0,
+                    help='also print the N most executed mnemonics')
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True,
+                    help='always re-parse the objdump file instead of using its .idx cache')
+    profiling.add_options(parser)
+    (options, args) = parser.parse_args()
+    if not options.histogram_file or not options.objdump_file:
+        parser.error('Please give input filenames with -f and -d')
+    num_mnemonics = int(options.mnemonics)
+
+    profiler = profiling.from_options(options)
+    with profiler.stage('histogram_load'):
+        (pcs, counts) = histogram.load_histogram(options.histogram_file)
+    if not int(counts.sum()):
+        print "%s is empty. Exiting." % (options.histogram_file)
+        profiler.finish()
+        return
+    with profiler.stage('objdump_load'):
+        index = objdump.load_objdump(options.objdump_file, options.cache)
+
+    with profiler.stage('opcode_mix'):
+        mix = opcode_mix(index, pcs, counts)
+    (insts, nbytes) = mix['classes']
+    total_insts = int(insts.sum())
+    if not total_insts:
+        print "No instruction of %s is in %s. Exiting." % \
+            (options.histogram_file, options.objdump_file)
+        profiler.finish()
+        return
+
+    executed = np.nonzero(insts)[0]
+    names = opcode_classes.class_names()
+    print_table('class', [names[c] for c in executed], insts[executed], nbytes[executed],
+                total_insts)
+
+    (insts, nbytes) = mix['sizes']
+    executed = np.nonzero(insts)[0]
+    print
+    print_table('size', ['%d bytes' % s for s in executed], insts[executed], nbytes[executed],
+                total_insts)
+
+    if num_mnemonics:
+        (insts, nbytes) = mix['mnemonics']
+        # most executed first; ties go to the first interned
+        order = len(insts) - 1 - np.argsort(insts[::-1], kind='mergesort')[::-1]
+        order = order[insts[order] > 0][:num_mnemonics]
+        print
+        print_table('mnemonic', [index.mnemonics[m] or '?' for m in order], insts[order],
+                    nbytes[order], total_insts)
+
+    print
+    print 'Total:%15u, Dynamic bytes:%15u, Not in program:%15u' % \
+        (total_insts, int(mix['sizes'][1].sum()), mix['not_in_program'])
+    profiler.finish()
+
+
+if __name__ == '__main__':
+  main()
@@ -10,14 +10,159 @@
 
 #include <vector>
 #include <map>
+#include <utility>
+#include <algorithm>
+
+/* ===================================================================== */
+/* PC -> count hash table                                                */
+/*                                                                       */
+/* Open addressing with linear probing, kept at most half full. Every    */
+/* thread owns one, so counting never takes a lock.                      */
+/* ===================================================================== */
+
+class PcTable
+{
+  public:
+    PcTable() : keys(1 << 12, EmptyKey), counts(1 << 12, 0), used(0) {}
+
+    VOID Add(ADDRINT pc, UINT64 n)
+    {
+        size_t mask = keys.size() - 1;
+        size_t i = Hash(pc) & mask;
+        while (keys[i] != pc) {
+            if (keys[i] == EmptyKey) {
+                if (2*(used + 1) > keys.size()) {
+                    Grow();
+                    Add(pc, n);
+                    return;
+                }
+                keys[i] = pc;
+                used++;
+                break;
+            }
+            i = (i + 1) & mask;
+        }
+        counts[i] += n;
+    }
+
+    template <class F> VOID ForEach(F f) const
+    {
+        for (size_t i = 0; i < keys.size(); i++) {
+            if (keys[i] != EmptyKey)
+                f(keys[i], counts[i]);
+        }
+    }
+
+    VOID Clear()
+    {
+        std::fill(keys.begin(), keys.end(), EmptyKey);
+        std::fill(counts.begin(), counts.end(), 0);
+        used = 0;
+    }
+
+  private:
+    static const ADDRINT EmptyKey = ~(ADDRINT) 0;
+
+    static size_t Hash(ADDRINT pc)
+    {
+        UINT64 h = (UINT64) pc * 0x9e3779b97f4a7c15ULL;
+        return (size_t) (h ^ (h >> 32));
+    }
+
+    VOID Grow()
+    {
+        std::vector<ADDRINT> old_keys;
+        std::vector<UINT64> old_counts;
+        old_keys.swap(keys);
+        old_counts.swap(counts);
+        keys.assign(old_keys.size() * 2, EmptyKey);
+        counts.assign(old_counts.size() * 2, 0);
+        used = 0;
+        for (size_t i = 0; i < old_keys.size(); i++) {
+            if (old_keys[i] != EmptyKey)
+                Add(old_keys[i], old_counts[i]);
+        }
+    }
+
+    std::vector<ADDRINT> keys;
+    std::vector<UINT64> counts;
+    size_t used;
+};
+
+const ADDRINT PcTable::EmptyKey;
+
+typedef std::vector< std::pair<ADDRINT,UINT64> > Histogram;
 
 /* ===================================================================== */
 /* Global Variables */
 /* ===================================================================== */
 
 std::ofstream TraceFile;
-  
-std::map<size_t,size_t> pc_histogram;
+std::ofstream IntervalFile;
+
+// BBL mode: the instruction PCs of every block, and the id given to each
+// (address, size) block at instrumentation time
+std::vector< std::vector<ADDRINT> > bbl_pcs;
+std::map<std::pair<ADDRINT,UINT32>, UINT32> bbl_ids;
+
+// INS mode counts PCs in a hash table, BBL mode counts executions of each
+// basic block (indexed by block id)
+struct Counters
+{
+    PcTable pcs;
+    std::vector<UINT64> bbls;
+
+    VOID Append(Histogram &entries) const
+    {
+        pcs.ForEach([&entries](ADDRINT pc, UINT64 n) {
+            entries.push_back(std::make_pair(pc, n));
+        });
+        for (size_t id = 0; id < bbls.size(); id++) {
+            UINT64 n = bbls[id];
+            if (n == 0)
+                continue;
+            for (size_t i = 0; i < bbl_pcs[id].size(); i++) {
+                entries.push_back(std::make_pair(bbl_pcs[id][i], n));
+            }
+        }
+    }
+
+    VOID Add(const Counters &other)
+    {
+        PcTable &table = pcs;
+        other.pcs.ForEach([&table](ADDRINT pc, UINT64 n) {
+            table.Add(pc, n);
+        });
+        if (bbls.size() < other.bbls.size())
+            bbls.resize(other.bbls.size(), 0);
+        for (size_t id = 0; id < other.bbls.size(); id++) {
+            bbls[id] += other.bbls[id];
+        }
+    }
+
+    VOID Clear()
+    {
+        pcs.Clear();
+        std::fill(bbls.begin(), bbls.end(), 0);
+    }
+};
+
+// with -interval, counts since the last snapshot live in delta and are
+// folded into total when the snapshot is written
+struct ThreadData
+{
+    THREADID tid;
+    Counters delta;
+    Counters total;
+    UINT64 interval_insts;
+};
+
+TLS_KEY tls_key;
+PIN_LOCK threads_lock;
+std::vector<ThreadData*> threads;
+
+UINT64 interval_length;
+UINT64 intervals_written = 0;
 
 /* ===================================================================== */
 /* Commandline Switches */
@@ -25,6 +170,30 @@ std::map<size_t,size_t> pc_histogram;
 
 KNOB<string> KnobOutputFile(KNOB_MODE_WRITEONCE, "pintool",
     "o", "trace.out", "specify trace file name");
+KNOB<string> KnobFormat(KNOB_MODE_WRITEONCE, "pintool",
+    "format", "text", "histogram format: text, or bin for packed records");
+KNOB<string> KnobMode(KNOB_MODE_WRITEONCE, "pintool",
+    "mode", "ins", "count per instruction (ins), or per basic block (bbl, "
+    "expanded to PCs at exit; faster, but a block's instructions all get its "
+    "count, so REP iterations and predicated-off instructions count differently)");
+KNOB<UINT64> KnobInterval(KNOB_MODE_WRITEONCE, "pintool",
+    "interval", "0", "also append a delta histogram to <o>.intervals every N "
+    "instructions of a thread (0 = off)");
+
+/* ===================================================================== */
+/* Binary histogram format                                               */
+/*                                                                       */
+/*   8 bytes   magic "PCHISTB1"                                          */
+/*   8 bytes   number of records                                         */
+/*   records   (u64 pc, u64 count), sorted by pc                         */
+/*                                                                       */
+/* All integers are little-endian. An intervals file is a sequence of    */
+/* these; in text format every interval is a full histogram preceded by  */
+/* "# interval <n> thread <tid> instructions <count>", and the file ends  */
+/* with "# end of intervals".                                            */
+/* ===================================================================== */
+
+const char BinaryMagic[] = "PCHISTB1";
 
 /* ===================================================================== */
 /* Print Help Message                                                    */
@@ -45,31 +214,176 @@ INT32 Usage()
  
 /* ===================================================================== */
 
-VOID countip(void *ip)
+// sort by PC and sum the counts of repeated PCs
+VOID SortHistogram(Histogram &entries)
 {
-   INT64 pc = (INT64) ip;
-   pc_histogram[pc]++;
+    std::sort(entries.begin(), entries.end());
+    size_t out = 0;
+    for (size_t i = 0; i < entries.size(); i++) {
+        if (out > 0 && entries[out-1].first == entries[i].first)
+            entries[out-1].second += entries[i].second;
+        else
+            entries[out++] = entries[i];
+    }
+    entries.resize(out);
+}
+
+VOID WriteU64(std::ofstream &out, UINT64 value)
+{
+    char bytes[8];
+    for (int i = 0; i < 8; i++) {
+      bytes[i] = (char) ((value >> (8*i)) & 0xff);
+    }
+    out.write(bytes, 8);
+}
+
+VOID WriteHistogram(std::ofstream &out, const Histogram &pc_histogram)
+{
+    if (KnobFormat.Value() == "bin") {
+      out.write(BinaryMagic, 8);
+      WriteU64(out, pc_histogram.size());
+      for(auto iterator = pc_histogram.begin(); iterator != pc_histogram.end(); ++iterator) {
+        WriteU64(out, iterator->first);
+        WriteU64(out, iterator->second);
+      }
+      return;
+    }
+
+    // '\n' rather than endl, which would flush after every PC
+    out << "PC Histogram size:" << pc_histogram.size() << "\n";
+    for(auto iterator = pc_histogram.begin(); iterator != pc_histogram.end(); ++iterator) {
+      out << hex << iterator->first << " " << dec << iterator->second << "\n";
+    }
+
+    out << "# eof of Pin Trace File" << endl;
+}
+
+/* ===================================================================== */
+
+// append the thread's counts since its last snapshot to the intervals file.
+// Expanding blocks to PCs reads bbl_pcs, which BblId() grows on other threads
+// under Pin's client lock, so analysis routines take that lock around it (Fini
+// is called with it already held).
+VOID WriteInterval(ThreadData *td, bool lock_client)
+{
+    Histogram entries;
+    if (lock_client)
+        PIN_LockClient();
+    td->delta.Append(entries);
+    if (lock_client)
+        PIN_UnlockClient();
+    SortHistogram(entries);
+
+    PIN_GetLock(&threads_lock, td->tid + 1);
+    if (KnobFormat.Value() != "bin") {
+        IntervalFile << "# interval " << intervals_written << " thread " << td->tid
+                     << " instructions " << td->interval_insts << "\n";
+    }
+    WriteHistogram(IntervalFile, entries);
+    IntervalFile.flush();
+    intervals_written++;
+    PIN_ReleaseLock(&threads_lock);
+
+    td->total.Add(td->delta);
+    td->delta.Clear();
+    td->interval_insts = 0;
+}
+
+/* ===================================================================== */
+
+VOID ThreadStart(THREADID tid, CONTEXT *ctxt, INT32 flags, VOID *v)
+{
+    ThreadData *td = new ThreadData;
+    td->tid = tid;
+    td->interval_insts = 0;
+    PIN_SetThreadData(tls_key, td, tid);
+
+    PIN_GetLock(&threads_lock, tid + 1);
+    threads.push_back(td);
+    PIN_ReleaseLock(&threads_lock);
+}
+
+/* ===================================================================== */
+
+VOID PIN_FAST_ANALYSIS_CALL countip(THREADID tid, ADDRINT pc)
+{
+    ThreadData *td = static_cast<ThreadData*>(PIN_GetThreadData(tls_key, tid));
+    td->delta.pcs.Add(pc, 1);
+    if (++td->interval_insts >= interval_length)
+        WriteInterval(td, true);
+}
+
+VOID PIN_FAST_ANALYSIS_CALL countbbl(THREADID tid, UINT32 id, UINT32 num_ins)
+{
+    ThreadData *td = static_cast<ThreadData*>(PIN_GetThreadData(tls_key, tid));
+    std::vector<UINT64> &bbls = td->delta.bbls;
+    if (id >= bbls.size())
+        bbls.resize(std::max<size_t>(id + 1, 2 * bbls.size()), 0);
+    bbls[id]++;
+    td->interval_insts += num_ins;
+    if (td->interval_insts >= interval_length)
+        WriteInterval(td, true);
 }
 
 /* ===================================================================== */
 
 VOID Instruction(INS ins, VOID *v)
 {
-    INS_InsertCall(ins, IPOINT_BEFORE, (AFUNPTR) countip, IARG_INST_PTR, IARG_END);
+    INS_InsertCall(ins, IPOINT_BEFORE, (AFUNPTR) countip,
+                   IARG_FAST_ANALYSIS_CALL, IARG_THREAD_ID, IARG_INST_PTR, IARG_END);
+}
+
+// instrumentation runs under Pin's client lock, so bbl_ids and bbl_pcs need no
+// other lock (readers outside instrumentation take it too, see WriteInterval)
+UINT32 BblId(BBL bbl)
+{
+    std::pair<ADDRINT,UINT32> key(BBL_Address(bbl), BBL_NumIns(bbl));
+    auto found = bbl_ids.find(key);
+    if (found != bbl_ids.end())
+        return found->second;
+
+    UINT32 id = bbl_pcs.size();
+    bbl_ids[key] = id;
+    bbl_pcs.push_back(std::vector<ADDRINT>());
+    for (INS ins = BBL_InsHead(bbl); INS_Valid(ins); ins = INS_Next(ins)) {
+        bbl_pcs[id].push_back(INS_Address(ins));
+    }
+    return id;
+}
+
+VOID Trace(TRACE trace, VOID *v)
+{
+    for (BBL bbl = TRACE_BblHead(trace); BBL_Valid(bbl); bbl = BBL_Next(bbl)) {
+        BBL_InsertCall(bbl, IPOINT_BEFORE, (AFUNPTR) countbbl,
+                       IARG_FAST_ANALYSIS_CALL, IARG_THREAD_ID,
+                       IARG_UINT32, BblId(bbl), IARG_UINT32, BBL_NumIns(bbl), IARG_END);
+    }
 }
  
 /* ===================================================================== */
 
 VOID Fini(INT32 code, VOID *v)
 {
-    TraceFile << "PC Histogram size:" << pc_histogram.size() << endl;
-    for(auto iterator = pc_histogram.begin(); iterator != pc_histogram.end(); ++iterator) {
-      TraceFile << hex << iterator->first << " " << dec << iterator->second << endl;
+    // merge every thread's counters into one PC-sorted histogram
+    Histogram pc_histogram;
+    for (size_t t = 0; t < threads.size(); t++) {
+        threads[t]->total.Append(pc_histogram);
+        threads[t]->delta.Append(pc_histogram);
     }
+    SortHistogram(pc_histogram);
 
-    TraceFile << "# eof of Pin Trace File" << endl;
-    
+    WriteHistogram(TraceFile, pc_histogram);
     TraceFile.close();
+
+    if (IntervalFile.is_open()) {
+        for (size_t t = 0; t < threads.size(); t++) {
+            if (threads[t]->interval_insts > 0)
+                WriteInterval(threads[t], false);
+        }
+        if (KnobFormat.Value() != "bin")
+            IntervalFile << "# end of intervals" << endl;
+        IntervalFile.close();
+    }
 }
 
 /* ===================================================================== */
@@ -88,11 +402,37 @@ int  main(int argc, char *argv[])
     }
     
 
-    TraceFile.open(KnobOutputFile.Value().c_str());
+    if (KnobFormat.Value() != "text" && KnobFormat.Value() != "bin")
+    {
+        cerr << "Unknown -format " << KnobFormat.Value() << endl;
+        return Usage();
+    }
+
+    if (KnobMode.Value() != "bbl" && KnobMode.Value() != "ins")
+    {
+        cerr << "Unknown -mode " << KnobMode.Value() << endl;
+        return Usage();
+    }
+
+    TraceFile.open(KnobOutputFile.Value().c_str(), std::ios::out | std::ios::binary);
     //TraceFile.write(trace_header.c_str(),trace_header.size());
     
-        
-    INS_AddInstrumentFunction(Instruction, 0);
+    interval_length = KnobInterval.Value();
+    if (interval_length > 0) {
+        string name = KnobOutputFile.Value() + ".intervals";
+        IntervalFile.open(name.c_str(), std::ios::out | std::ios::binary);
+    } else {
+        interval_length = ~(UINT64) 0;
+    }
+
+    tls_key = PIN_CreateThreadDataKey(0);
+    PIN_InitLock(&threads_lock);
+    PIN_AddThreadStartFunction(ThreadStart, 0);
+
+    if (KnobMode.Value() == "ins")
+        INS_AddInstrumentFunction(Instruction, 0);
+    else
+        TRACE_AddInstrumentFunction(Trace, 0);
     PIN_AddFiniFunction(Fini, 0);
 
     // Never returns
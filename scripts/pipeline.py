@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Our goal:
+#
+# INPUT:
+#   - a manifest of every (ISA, benchmark, workload) cell, one per line:
+#
+#         <isa> <benchmark> <workload> <histogram file> <objdump file>
+#
+#     blank lines and lines starting with '#' are ignored
+#
+# OUTPUT:
+#   - fused_ops_analysis.py's stats for every cell, in the results store
+#     (see results.py)
+#   - then the figures, regenerated from the store
+#
+# Each cell's inputs are fingerprinted (size, mtime and hash) along with the
+# version of the analysis code and the idioms counted. A cell is re-analyzed
+# only when one of those changed since its results were recorded, so touching
+# one binary only re-runs the cells that use it.
+
+import json
+import multiprocessing
+import optparse
+import os
+import subprocess
+import sys
+
+import filecache
+import fusion_rules
+import fused_ops_batch
+import objdump
+import results
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the code a cell's results depend on
+ANALYSIS_SOURCES = ['fused_ops_analysis.py', 'fused_ops_batch.py', 'fusion_rules.py',
+                    'histogram.py', 'objdump.py', 'filecache.py']
+
+CELLS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    isa TEXT NOT NULL,
+    benchmark TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    config TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    PRIMARY KEY (isa, benchmark, workload, config)
+)
+"""
+
+
+def read_manifest(filename):
+    cells = []
+    f = open(filename)
+    for (lineno, line) in enumerate(f):
+        bits = line.split()
+        if not bits or bits[0].startswith('#'):
+            continue
+        if len(bits) != 5:
+            raise ValueError('%s:%d: expected "<isa> <benchmark> <workload> <histogram> <objdump>"' %
+                             (filename, lineno + 1))
+        cells.append(tuple(bits))
+    f.close()
+    return cells
+
+
+# a hash of the analysis code, so changing it invalidates every cell
+def code_version():
+    return ','.join(filecache.file_hash(os.path.join(SCRIPT_DIR, s))[:12]
+                    for s in ANALYSIS_SOURCES)
+
+
+# filename -> fingerprint, so an objdump shared by many cells is hashed once
+FINGERPRINTS = {}
+
+
+def hashed_fingerprint(filename):
+    if filename not in FINGERPRINTS:
+        FINGERPRINTS[filename] = filecache.fingerprint(filename, with_hash=True)
+    return FINGERPRINTS[filename]
+
+
+def cell_inputs(histogram_file, objdump_file, version, rule_names):
+    return {'histogram': os.path.abspath(histogram_file),
+            'histogram_fp': hashed_fingerprint(histogram_file),
+            'objdump': os.path.abspath(objdump_file),
+            'objdump_fp': hashed_fingerprint(objdump_file),
+            'code': version,
+            'idioms': rule_names}
+
+
+def is_stale(stored, histogram_file, objdump_file, version, rule_names):
+    if stored is None:
+        return True
+    return (stored['histogram'] != os.path.abspath(histogram_file) or
+            stored['objdump'] != os.path.abspath(objdump_file) or
+            stored['code'] != version or
+            stored['idioms'] != rule_names or
+            not filecache.is_fresh(stored['histogram_fp'], histogram_file) or
+            not filecache.is_fresh(stored['objdump_fp'], objdump_file))
+
+
+def stored_inputs(db, isa, benchmark, workload, config):
+    row = db.execute('SELECT inputs FROM cells WHERE isa = ? AND benchmark = ? AND '
+                     'workload = ? AND config = ?', (isa, benchmark, workload, config)).fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0])
+
+
+def record_cell(db, isa, benchmark, workload, config, inputs, stats):
+    results.record(db, isa, benchmark, workload, config, stats)
+    db.execute('INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?)',
+               (isa, benchmark, workload, config, json.dumps(inputs)))
+    db.commit()
+
+
+# (isa, benchmark, workloads recorded, workloads it has) of the benchmarks
+# among recorded cells that don't have all their workloads recorded yet, so
+# their totals aren't the sum of the workloads
+def incomplete_benchmarks(db, config, recorded):
+    counts = results.workload_counts(db)
+    incomplete = []
+    for (isa, benchmark) in sorted(set((c[0], c[1]) for c in recorded)):
+        if benchmark not in counts:
+            continue
+        (n,) = db.execute('SELECT COUNT(DISTINCT workload) FROM results WHERE isa = ? AND '
+                          'benchmark = ? AND config = ? AND workload != ?',
+                          (isa, benchmark, config, results.ALL_WORKLOADS)).fetchone()
+        if n < counts[benchmark]:
+            incomplete.append((isa, benchmark, n, counts[benchmark]))
+    return incomplete
+
+
+# run each (script, arguments) in order; returns whether they all succeeded
+def run_figures(scripts):
+    ok = True
+    for (script, script_args) in scripts:
+        print "Regenerating figures: %s" % (script)
+        if subprocess.call([sys.executable, os.path.join(SCRIPT_DIR, script)] + script_args):
+            print >>sys.stderr, "%s failed" % (script)
+            ok = False
+    return ok
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] manifest')
+    parser.add_option('--db', dest='db', default=results.DEFAULT_DB,
+                    help='results database [default: %default]')
+    parser.add_option('--config', dest='config', default='o3',
+                    help='compiler config the binaries were built with [default: %default]')
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='number of worker processes [default: %default]')
+    parser.add_option('-i', '--idioms', dest='idioms',
+                    help='comma-separated idioms to count (see fused_ops_analysis.py -h)')
+    parser.add_option('--force', dest='force', action='store_true', default=False,
+                    help='re-analyze every cell, stale or not')
+    parser.add_option('-n', '--dry-run', dest='dry_run', action='store_true', default=False,
+                    help='only list the stale cells')
+    parser.add_option('--figures', dest='figures', type='choice', default='changed',
+                    choices=['changed', 'always', 'never'],
+                    help='regenerate the figures: changed (if any cell re-ran), always '
+                         'or never [default: %default]')
+    parser.add_option('--cdf', dest='cdf', action='store_true', default=False,
+                    help='also regenerate the CDF figures (from the current directory)')
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Please give a manifest file')
+    rule_names = options.idioms.split(',') if options.idioms else None
+    try:
+        rules = fusion_rules.get_rules(rule_names)
+        cells = read_manifest(args[0])
+    except ValueError, e:
+        parser.error(str(e))
+    rule_names = [r.name for r in rules]
+
+    db = results.open_store(options.db)
+    db.execute(CELLS_SCHEMA)
+    version = code_version()
+
+    stale = []
+    for (isa, benchmark, workload, histogram_file, objdump_file) in cells:
+        stored = stored_inputs(db, isa, benchmark, workload, options.config)
+        if options.force or is_stale(stored, histogram_file, objdump_file, version, rule_names):
+            stale.append((isa, benchmark, workload, histogram_file, objdump_file))
+    print "%d of %d cells are stale" % (len(stale), len(cells))
+    for (isa, benchmark, workload, histogram_file, objdump_file) in stale:
+        print "    %-8s %-16s %-4s %s" % (isa, benchmark, workload, histogram_file)
+    if options.dry_run:
+        return
+
+    # parse only the objdumps the stale cells need, once each, before forking
+    for (isa, benchmark, workload, histogram_file, objdump_file) in stale:
+        if objdump_file not in fused_ops_batch.INDEXES:
+            fused_ops_batch.INDEXES[objdump_file] = objdump.load_objdump(objdump_file)
+
+    tasks = [('%s %s %s' % (isa, benchmark, workload), workload, h, d, rule_names)
+             for (isa, benchmark, workload, h, d) in stale]
+    if options.jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(options.jobs, len(tasks)))
+        analyzed = pool.imap(fused_ops_batch.analyze_entry, tasks)
+    else:
+        pool = None
+        analyzed = (fused_ops_batch.analyze_entry(t) for t in tasks)
+
+    # record each cell as soon as it's done, so an interrupted sweep resumes
+    recorded = []
+    for (cell, result) in zip(stale, analyzed):
+        (isa, benchmark, workload, histogram_file, objdump_file) = cell
+        if result is None:
+            print >>sys.stderr, "%s is empty. Skipping." % (histogram_file)
+            continue
+        inputs = cell_inputs(histogram_file, objdump_file, version, rule_names)
+        record_cell(db, isa, benchmark, workload, options.config, inputs, result[-1])
+        recorded.append(cell)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    for (isa, benchmark, n, expected) in incomplete_benchmarks(db, options.config, recorded):
+        print "%s %s: %d of %d workloads recorded; until all are, the figures use its " \
+            "imported totals (or stop without them)" % (isa, benchmark, n, expected)
+    db.close()
+
+    if options.figures == 'never' or (options.figures == 'changed' and not recorded):
+        return
+    scripts = [('gen-figures.py', ['--db', options.db, '--config', options.config])]
+    if options.cdf:
+        scripts.append(('gen-cdf-figures.py', ['-j', str(options.jobs)]))
+    if not run_figures(scripts):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
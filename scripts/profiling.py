@@ -0,0 +1,106 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Per-stage timing for the analysis scripts.
+#
+# A script wraps each of its stages (reading the histogram, parsing the
+# objdump, ranking, ...) in profiler.stage(name). With --profile, every stage
+# is reported as one JSON line:
+#
+#   {"script": ..., "stage": ..., "wall_s": ..., "cpu_s": ...,
+#    "peak_rss_kb": ..., "rss_growth_kb": ...}
+#
+# peak_rss_kb is the process's peak RSS when the stage ended and
+# rss_growth_kb how much the stage raised it. A final "total" line covers the
+# whole run. --cprofile FILE also saves cProfile stats of the run, for pstats.
+#
+# Without --profile, stage() costs next to nothing.
+
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+
+
+def add_options(parser):
+    parser.add_option('--profile', dest='profile', action='store_true', default=False,
+                    help='report wall/CPU time and peak memory of every stage, as JSON lines')
+    parser.add_option('--profile-output', dest='profile_output',
+                    help='append the --profile report to this file (default: stderr)')
+    parser.add_option('--cprofile', dest='cprofile',
+                    help='save cProfile stats of the run to this file')
+
+
+# (wall seconds, CPU seconds, peak RSS in KB) so far
+def usage():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return (time.time(), r.ru_utime + r.ru_stime, r.ru_maxrss)
+
+
+class Profiler(object):
+
+    def __init__(self, enabled=False, output=None, cprofile_file=None, script=None):
+        self.enabled = enabled or bool(cprofile_file)
+        self.report = enabled
+        self.output = output
+        self.cprofile_file = cprofile_file
+        self.script = script or os.path.basename(sys.argv[0])
+        self.stages = []
+        self.profile = None
+        self.start_usage = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        before = usage()
+        yield
+        after = usage()
+        self.stages.append(self._record(name, before, after))
+
+    def _record(self, name, before, after):
+        return {'script': self.script, 'stage': name,
+                'wall_s': after[0] - before[0], 'cpu_s': after[1] - before[1],
+                'peak_rss_kb': after[2], 'rss_growth_kb': after[2] - before[2]}
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.start_usage = usage()
+        if self.cprofile_file:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def finish(self):
+        if not self.enabled or self.start_usage is None:
+            return
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.cprofile_file)
+            self.profile = None
+        self.stages.append(self._record('total', self.start_usage, usage()))
+        self.start_usage = None
+        if not self.report:
+            return
+        out = open(self.output, 'a') if self.output else sys.stderr
+        for s in self.stages:
+            out.write(json.dumps(s, sort_keys=True) + '\n')
+        if self.output:
+            out.close()
+        else:
+            out.flush()
+
+
+# a profiler for a script's parsed options (see add_options()), started
+def from_options(options):
+    p = Profiler(options.profile, options.profile_output, options.cprofile)
+    p.start()
+    return p
+
+
+# a profiler that measures nothing, for code called without one
+DISABLED = Profiler()
@@ -0,0 +1,77 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Hot code regions of a histogram.
+#
+# The executed PCs are sorted by address once, and every run of instructions
+# that follow each other directly (the next PC is this PC plus this
+# instruction's size) becomes one region, whatever the counts of its
+# instructions. So a loop body is one region, even when some of its paths run
+# more often than others. Regions are ranked by their total dynamic count.
+
+import numpy as np
+
+
+class Regions(object):
+
+    # sizes are the instructions' sizes in bytes, aligned with pcs; a size of
+    # 0 (e.g. a PC missing from the objdump) ends a region. Without sizes, a
+    # gap of 2 or 4 bytes (RVC or not) counts as contiguous.
+    def __init__(self, pcs, counts, sizes=None):
+        order = np.argsort(pcs, kind='mergesort')
+        self.pcs = pcs[order]
+        self.counts = counts[order]
+        self.total = int(self.counts.sum())
+
+        gap = self.pcs[1:] - self.pcs[:-1]
+        if sizes is not None:
+            contiguous = gap == sizes[order][:-1]
+        else:
+            contiguous = (gap == 2) | (gap == 4)
+        breaks = np.nonzero(~contiguous)[0] + 1
+        if len(self.pcs):
+            self.starts = np.concatenate(([0], breaks))
+        else:
+            self.starts = np.zeros(0, dtype=np.intp)
+        self.ends = np.concatenate((self.starts[1:], [len(self.pcs)])).astype(np.intp)
+        if len(self.starts):
+            self.region_counts = np.add.reduceat(self.counts, self.starts)
+        else:
+            self.region_counts = np.zeros(0, dtype=np.uint64)
+
+        # hottest first; ties go to the lower address
+        n = len(self.region_counts)
+        self.ranked = n - 1 - np.argsort(self.region_counts[::-1], kind='mergesort')[::-1]
+        self.cumulative = np.cumsum(self.region_counts[self.ranked])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def start_pc(self, r):
+        return int(self.pcs[self.starts[r]])
+
+    # the PC of the region's last instruction
+    def end_pc(self, r):
+        return int(self.pcs[self.ends[r] - 1])
+
+    def num_insts(self, r):
+        return int(self.ends[r] - self.starts[r])
+
+    def count(self, r):
+        return int(self.region_counts[r])
+
+    # the region's PCs, by address
+    def members(self, r):
+        return self.pcs[self.starts[r]:self.ends[r]]
+
+    # the n hottest regions, hottest first
+    def top(self, n):
+        return self.ranked[:n]
+
+    # the hottest regions, up to and including the one that takes the CDF
+    # past percent
+    def top_to_cdf(self, percent):
+        if not self.total:
+            return self.ranked[:0]
+        cdf = self.cumulative * 100. / self.total
+        return self.ranked[:int(np.searchsorted(cdf, percent, side='right')) + 1]
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# A store for analysis results, so figures are generated from what the
+# analysis scripts measured instead of from numbers copied by hand.
+#
+# Results live in one SQLite table, one row per measured value:
+#
+#   isa, benchmark, workload, config, metric -> value
+#
+# e.g. ('RV64GC', '401.bzip2', '3', 'o3', 'total_bytes') -> 9271905473172.
+# config names the compiler flags/toolchain the binary was built with. A
+# benchmark's total of a metric is either the sum of its workloads or a single
+# 'all' workload holding the total (as imported from the paper's numbers).
+# The workloads only replace an 'all' row once every workload of the
+# benchmark is recorded; with neither, the total is missing. How many
+# workloads a benchmark has comes from WORKLOADS (the SPEC CPU2006 reference
+# inputs), or the workloads table for anything else:
+#
+#   benchmark -> number of workloads
+#
+# Used as a script, it imports and exports CSV files with the same columns,
+# and sets a benchmark's number of workloads:
+#
+#   $./results.py import results-o3.csv
+#   $./results.py export > everything.csv
+#   $./results.py workloads 999.specrand 1
+
+import csv
+import optparse
+import sqlite3
+import sys
+
+DEFAULT_DB = 'results.db'
+ALL_WORKLOADS = 'all'
+COLUMNS = ['isa', 'benchmark', 'workload', 'config', 'metric', 'value']
+
+# reference inputs of each SPEC CINT2006 benchmark
+WORKLOADS = {'400.perlbench': 3, '401.bzip2': 6, '403.gcc': 9, '429.mcf': 1,
+             '445.gobmk': 5, '456.hmmer': 2, '458.sjeng': 1, '462.libquantum': 1,
+             '464.h264ref': 3, '471.omnetpp': 1, '473.astar': 2, '483.xalancbmk': 1}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    isa TEXT NOT NULL,
+    benchmark TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    config TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value NUMERIC,
+    PRIMARY KEY (isa, benchmark, workload, config, metric)
+);
+CREATE TABLE IF NOT EXISTS workloads (
+    benchmark TEXT NOT NULL PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+
+
+def open_store(filename=DEFAULT_DB):
+    db = sqlite3.connect(filename, timeout=60)
+    db.executescript(SCHEMA)
+    return db
+
+
+# store every metric -> value of stats for one (isa, benchmark, workload,
+# config), replacing earlier values
+def record(db, isa, benchmark, workload, config, stats):
+    rows = [(isa, benchmark, str(workload), config, metric, value)
+            for (metric, value) in sorted(stats.items())]
+    db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)', rows)
+    db.commit()
+
+
+def set_workload_count(db, benchmark, count):
+    db.execute('INSERT OR REPLACE INTO workloads VALUES (?, ?)', (benchmark, count))
+    db.commit()
+
+
+# {benchmark: number of workloads}, for the benchmarks it is known for
+def workload_counts(db):
+    counts = dict(WORKLOADS)
+    counts.update(db.execute('SELECT benchmark, count FROM workloads').fetchall())
+    return counts
+
+
+# the totals of metric under config, as ({(isa, benchmark): total},
+# {(isa, benchmark): (workloads recorded, workloads it has)}). The second
+# holds the benchmarks whose workloads are only partly recorded and have no
+# 'all' row to fall back on; they have no total.
+def benchmark_totals(db, metric, config, isas=None):
+    everything = {}
+    per_workload = {}
+    cur = db.execute('SELECT isa, benchmark, workload, value FROM results '
+                     'WHERE metric = ? AND config = ?', (metric, config))
+    for (isa, benchmark, workload, value) in cur:
+        if isas is not None and isa not in isas:
+            continue
+        if workload == ALL_WORKLOADS:
+            everything[(isa, benchmark)] = value
+        else:
+            per_workload.setdefault((isa, benchmark), []).append(value)
+
+    counts = workload_counts(db)
+    totals = dict(everything)
+    incomplete = {}
+    for ((isa, benchmark), values) in per_workload.items():
+        # without a known number of workloads, those recorded are all of them
+        expected = counts.get(benchmark, len(values))
+        if len(values) >= expected:
+            totals[(isa, benchmark)] = sum(values)
+        elif (isa, benchmark) not in everything:
+            incomplete[(isa, benchmark)] = (len(values), expected)
+    return (totals, incomplete)
+
+
+# a tuple of metric for isa under config, one entry per benchmark
+def series(db, isa, metric, config, benchmarks):
+    (totals, incomplete) = benchmark_totals(db, metric, config, [isa])
+    for b in benchmarks:
+        if (isa, b) in incomplete:
+            raise KeyError('only %d of the %d workloads of %s %s have %s (config %s)' %
+                           (incomplete[(isa, b)] + (isa, b, metric, config)))
+    missing = [b for b in benchmarks if (isa, b) not in totals]
+    if missing:
+        raise KeyError('no %s for %s %s (config %s)' %
+                       (metric, isa, ', '.join(missing), config))
+    return tuple(totals[(isa, b)] for b in benchmarks)
+
+
+def import_csv(db, f):
+    n = 0
+    for row in csv.DictReader(f):
+        value = row['value']
+        value = float(value) if '.' in value or 'e' in value else int(value)
+        record(db, row['isa'], row['benchmark'], row['workload'], row['config'],
+               {row['metric']: value})
+        n += 1
+    return n
+
+
+def export_csv(db, out):
+    w = csv.writer(out, lineterminator='\n')
+    w.writerow(COLUMNS)
+    for row in db.execute('SELECT %s FROM results ORDER BY %s' %
+                          (', '.join(COLUMNS), ', '.join(COLUMNS[:-1]))):
+        w.writerow(row)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] import file.csv... | export | '
+                                         'workloads benchmark count')
+    parser.add_option('--db', dest='db', default=DEFAULT_DB,
+                    help='results database [default: %default]')
+    (options, args) = parser.parse_args()
+    if not args or args[0] not in ('import', 'export', 'workloads'):
+        parser.error('Please give a command: import, export or workloads')
+    if args[0] == 'workloads' and (len(args) != 3 or not args[2].isdigit()):
+        parser.error('Please give a benchmark and its number of workloads')
+
+    db = open_store(options.db)
+    if args[0] == 'import':
+        for filename in args[1:]:
+            f = open(filename)
+            print "%s: %d results" % (filename, import_csv(db, f))
+            f.close()
+    elif args[0] == 'workloads':
+        set_workload_count(db, args[1], int(args[2]))
+    else:
+        export_csv(db, sys.stdout)
+    db.close()
+
+
+if __name__ == '__main__':
+  main()
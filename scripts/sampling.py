@@ -0,0 +1,87 @@
+# Copyright (c) 2016, The Regents of the University of California (Regents).
+# All Rights Reserved. See LICENSE for license details.
+
+# Samples of a histogram, for approximate answers with confidence intervals.
+#
+# A sample is a set of units, each with a count and a weight (how many
+# units of the whole histogram it stands for):
+#
+#   count_weighted() - n executed instructions drawn in proportion to their
+#                      counts (systematic PPS sampling): count 1, weight
+#                      total/n. Reads every count, but nothing else.
+#   strided()        - every stride-th PC of a binary histogram: its count,
+#                      weight stride. Reads only the sampled records.
+#
+# Anything per instruction (its size, whether it starts an idiom, ...) is then
+# estimated as a ratio of weighted sums, with the usual linearized variance.
+
+import numpy as np
+
+import histogram
+
+# two-sided normal quantiles
+Z = {90: 1.645, 95: 1.960, 99: 2.576}
+
+
+class Sample(object):
+
+    def __init__(self, pcs, counts, weights, method, population):
+        self.pcs = pcs
+        self.counts = counts
+        self.weights = weights
+        self.method = method
+        # how many PCs the histogram has
+        self.population = population
+
+    def __len__(self):
+        return len(self.pcs)
+
+    # estimate of sum(a)/sum(b) over the histogram, where a and b are given
+    # for every unit (already multiplied by its count), and the half-width of
+    # its confidence interval for z
+    def ratio(self, a, b, z):
+        wa = self.weights * a
+        wb = self.weights * b
+        denominator = wb.sum()
+        if not denominator:
+            return (0., 0.)
+        r = wa.sum() / denominator
+        return (r, z * _spread(wa - r * wb) / denominator)
+
+    # estimate of sum(a) over the histogram, and the half-width of its
+    # confidence interval for z
+    def total(self, a, z):
+        wa = self.weights * a
+        return (wa.sum(), z * _spread(wa - wa.mean()))
+
+
+# sqrt(n/(n-1) * sum(x^2)): the standard error of a sum of n deviations x
+def _spread(x):
+    n = len(x)
+    if n < 2:
+        return 0.
+    return np.sqrt(n / (n - 1.) * np.dot(x, x))
+
+
+# n executed instructions, drawn in proportion to their counts: one every
+# total/n, from a random start. The same PC may be drawn several times.
+def count_weighted(pcs, counts, n, seed=None):
+    cumulative = np.cumsum(counts, dtype=np.uint64)
+    total = int(cumulative[-1]) if len(cumulative) else 0
+    if not total:
+        return Sample(pcs[:0], np.zeros(0), np.zeros(0), 'count-weighted', len(pcs))
+    step = float(total) / n
+    rng = np.random.RandomState(seed)
+    points = ((rng.random_sample() + np.arange(n)) * step).astype(np.uint64)
+    drawn = cumulative.searchsorted(points, side='right')
+    return Sample(np.asarray(pcs[drawn]), np.ones(n), np.full(n, step),
+                  'count-weighted', len(pcs))
+
+
+# every stride-th PC of a binary histogram, from a random start
+def strided(filename, stride, seed=None):
+    records = histogram.map_binary(filename)
+    start = np.random.RandomState(seed).randint(stride) if stride > 1 else 0
+    picked = np.array(records[start::stride])
+    return Sample(picked['pc'], picked['count'].astype(np.float64),
+                  np.full(len(picked), float(stride)), 'strided', len(records))